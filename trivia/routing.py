@@ -1,7 +1,9 @@
 from django.urls import path
 
-from trivia_api.consumers import TriviaConsumer
+from trivia_api.consumers import LobbyConsumer, SpectatorConsumer, TriviaConsumer
 
 ws_urlpatterns = [
     path("ws/trivia/<int:game_id>/", TriviaConsumer.as_asgi()),
+    path("ws/lobby/", LobbyConsumer.as_asgi()),
+    path("ws/spectate/<int:game_id>/", SpectatorConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -103,12 +103,27 @@ if "DATABASE_URL" in os.environ:
     if "CI" in os.environ:
         DATABASES["default"]["TEST"] = DATABASES["default"]
 
+# Set CHANNEL_LAYER=trivia_api.layers.PostgresChannelLayer to run several daphne processes
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'BACKEND': env.str('CHANNEL_LAYER', default='channels.layers.InMemoryChannelLayer'),
     },
 }
 
+# Phase timers run inside each web worker unless a separate `manage.py run_orchestrator`
+# process is used (that requires a cross-process channel layer)
+TRIVIA_EXTERNAL_ORCHESTRATOR = env.bool('TRIVIA_EXTERNAL_ORCHESTRATOR', default=False)
+
+# Last game events kept per game for sockets that reconnect with ?last_seq=. Set
+# TRIVIA_JOURNAL_DB to keep them in the database instead, which a cross-process
+# channel layer or an external orchestrator requires (events of a game may be sent
+# by any process, TriviaConfig.ready refuses to start otherwise)
+TRIVIA_JOURNAL_SIZE = env.int('TRIVIA_JOURNAL_SIZE', default=500)
+TRIVIA_JOURNAL_DB = env.bool('TRIVIA_JOURNAL_DB', default=False)
+
+# Addresses allowed to scrape /metrics (each process exposes its own)
+TRIVIA_METRICS_IPS = env.list('TRIVIA_METRICS_IPS', default=['127.0.0.1', '::1'])
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
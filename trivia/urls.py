@@ -21,16 +21,24 @@ from rest_framework import routers
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from trivia.views import RegistrationView
-from trivia_api.views import GameViewSet, ProfileView
+from trivia_api import async_views
+from trivia_api.metrics import metrics_view
+from trivia_api.views import GameViewSet, ProfileView, ProfileGamesCreatedView, ProfileGamesJoinedView
 
 router = routers.SimpleRouter()
 router.register('games', GameViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
     path('registration/', csrf_exempt(RegistrationView.as_view())),
     path('api/profile/', csrf_exempt(ProfileView.as_view())),
+    path('api/profile/games_created/', csrf_exempt(ProfileGamesCreatedView.as_view()), name='profile-games_created'),
+    path('api/profile/games_joined/', csrf_exempt(ProfileGamesJoinedView.as_view()), name='profile-games_joined'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/games/<int:pk>/join_game/', async_views.join_game, name='game-join-game'),
+    path('api/games/<int:pk>/unjoin_game/', async_views.unjoin_game, name='game-unjoin-game'),
+    path('api/games/<int:pk>/state/', async_views.state, name='game-state'),
     path('api/', include(router.urls)),
 ]
@@ -1,6 +1,13 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Q
 
-from trivia_api.models import Game, Round, Move, Qualification, Fault, ActionError
+from trivia_api.models import Game, Membership, Round, Move, Qualification, Fault, ActionError, count_of
+
+
+class GameFilter(admin.RelatedFieldListFilter):
+    # the game choices are shown with their creator (Game.__str__)
+    def field_choices(self, field, request, model_admin):
+        return [(g.pk, str(g)) for g in Game.objects.select_related('creator')]
 
 
 @admin.register(Game)
@@ -8,31 +15,66 @@ class GameAdmin(admin.ModelAdmin):
     list_display = ('name', 'created', 'creator', 'players_count', 'is_open', 'started', 'ended',
                     'rounds_number', 'remaining_rounds', 'disqualified_players_count')
     list_filter = ('creator', 'started', 'ended')
+    list_select_related = ('creator', 'current_round')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            player_count=Count('memberships'),
+            disqualified_count=Count('memberships', filter=Q(memberships__disqualified=True)),
+        )
+
+    @admin.display(description="players_count")
+    def players_count(self, obj):
+        return obj.player_count
 
     @admin.display(description="disqualified_players")
     def disqualified_players_count(self, obj):
-        return len(obj.disqualified_players)
+        return obj.disqualified_count
+
+
+@admin.register(Membership)
+class MembershipAdmin(admin.ModelAdmin):
+    list_display = ('game', 'player', 'score', 'faults', 'errors', 'disqualified')
+    list_filter = ('disqualified', ('game', GameFilter))
+    list_select_related = ('game__creator', 'player')
 
 
 @admin.register(Round)
 class RoundAdmin(admin.ModelAdmin):
-    list_display = ('game', 'index', 'started', 'nosy', 'nosy_score', 'question', 'missing_players_count',
+    list_display = ('game', 'number', 'started', 'nosy', 'nosy_score', 'question', 'missing_players_count',
                     'missing_evaluations_count', 'ended')
-    list_filter = ('game', 'nosy')
+    list_filter = (('game', GameFilter), 'nosy')
+    list_select_related = ('game__creator', 'nosy')
+
+    def get_queryset(self, request):
+        moves = Move.objects.filter(round=OuterRef(OuterRef('pk'))).values('player')
+        return super().get_queryset(request).annotate(
+            qualifications_count=count_of(Qualification.objects.filter(move__round=OuterRef('pk'))),
+            negative_count=count_of(Qualification.objects.filter(move__round=OuterRef('pk'), is_correct=False)),
+            missing_players_total=count_of(Membership.objects.filter(game=OuterRef('game'), disqualified=False)
+                                     .exclude(player__in=moves)),
+            missing_evaluations_total=count_of(Move.objects.filter(round=OuterRef('pk'), evaluation__isnull=True)
+                                         .exclude(player=OuterRef('nosy'))),
+        )
+
+    @admin.display(description="nosy_score")
+    def nosy_score(self, obj):
+        return Round.score_for_nosy(obj.qualifications_count, obj.negative_count) if obj.ended else None
 
     @admin.display(description="missing_players")
     def missing_players_count(self, obj):
-        return len(obj.missing_players)
+        return obj.missing_players_total
 
     @admin.display(description="missing_evaluations")
     def missing_evaluations_count(self, obj):
-        return len(obj.missing_evaluations)
+        return obj.missing_evaluations_total
 
 
 @admin.register(Move)
 class MoveAdmin(admin.ModelAdmin):
     list_display = ('game', 'round_index', 'player', 'created', 'evaluation', 'auto_evaluation')
     list_filter = ('evaluation', 'auto_evaluation')
+    list_select_related = ('round__game__creator', 'player')
 
     @admin.display(description="game")
     def game(self, obj):
@@ -40,13 +82,14 @@ class MoveAdmin(admin.ModelAdmin):
 
     @admin.display(description="round_index")
     def round_index(self, obj):
-        return obj.round.index
+        return obj.round.number
 
 
 @admin.register(Qualification)
 class QualificationAdmin(admin.ModelAdmin):
     list_display = ('game', 'round_index', 'player', 'move_player', 'qualified', 'is_correct')
-    list_filter = ('move__round__game', 'is_correct', 'player')
+    list_filter = (('move__round__game', GameFilter), 'is_correct', 'player')
+    list_select_related = ('move__round__game__creator', 'move__player', 'player')
 
     @admin.display(description="move_player")
     def move_player(self, obj):
@@ -58,13 +101,14 @@ class QualificationAdmin(admin.ModelAdmin):
 
     @admin.display(description="round_index")
     def round_index(self, obj):
-        return obj.move.round.index
+        return obj.move.round.number
 
 
 @admin.register(Fault)
 class FaultAdmin(admin.ModelAdmin):
     list_display = ('game', 'round_index', 'player', 'category', 'fault_value')
-    list_filter = ('player', 'category', 'round__game')
+    list_filter = ('player', 'category', ('round__game', GameFilter))
+    list_select_related = ('round__game__creator', 'player')
 
     @admin.display(description="game")
     def game(self, obj):
@@ -72,13 +116,14 @@ class FaultAdmin(admin.ModelAdmin):
 
     @admin.display(description="round_index")
     def round_index(self, obj):
-        return obj.round.index
+        return obj.round.number
 
 
 @admin.register(ActionError)
 class ActionErrorAdmin(admin.ModelAdmin):
     list_display = ('game', 'round_index', 'player', 'action', 'error_message')
-    list_filter = ('player', 'action', 'round__game')
+    list_filter = ('player', 'action', ('round__game', GameFilter))
+    list_select_related = ('round__game__creator', 'player')
 
     @admin.display(description="game")
     def game(self, obj):
@@ -86,4 +131,4 @@ class ActionErrorAdmin(admin.ModelAdmin):
 
     @admin.display(description="round_index")
     def round_index(self, obj):
-        return obj.round.index if obj.round is not None else None
+        return obj.round.number if obj.round is not None else None
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
 
 
 class TriviaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trivia_api'
+
+    def ready(self):
+        from trivia_api.metrics import install_query_wrapper
+
+        connection_created.connect(install_query_wrapper)
+
+        # the in-memory journal numbers events per process, so the numbers of events
+        # sent by other processes would collide and reconnected sockets would drop them
+        backend = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND')
+        multi_process = backend != 'channels.layers.InMemoryChannelLayer' or settings.TRIVIA_EXTERNAL_ORCHESTRATOR
+        if multi_process and not settings.TRIVIA_JOURNAL_DB:
+            raise ImproperlyConfigured(
+                f'TRIVIA_JOURNAL_DB must be set with the {backend} channel layer or an external orchestrator'
+            )
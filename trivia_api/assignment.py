@@ -0,0 +1,21 @@
+def assign_reviews(reviewer_ids, moves):
+    # Pairs every reviewer with a move to qualify. moves is a list of (move_id, player_id)
+    # in answering order. Reviewers who answered take the next move in that order (a
+    # cyclic shift, so nobody gets their own answer) and the rest are spread round-robin,
+    # keeping the load of every move within one or two reviews. Returns a list of
+    # (reviewer_id, move_id); a reviewer whose answer is the only one gets nothing.
+    if len(moves) == 0:
+        return []
+
+    move_index = {player_id: i for i, (move_id, player_id) in enumerate(moves)}
+    pairs = []
+    next_move = 0
+    for reviewer_id in reviewer_ids:
+        own = move_index.get(reviewer_id)
+        if own is None:
+            pairs.append((reviewer_id, moves[next_move][0]))
+            next_move = (next_move + 1) % len(moves)
+        elif len(moves) > 1:
+            pairs.append((reviewer_id, moves[(own + 1) % len(moves)][0]))
+
+    return pairs
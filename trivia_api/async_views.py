@@ -0,0 +1,171 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from rest_framework import status
+from rest_framework_simplejwt.settings import api_settings
+
+from trivia_api.cache import invalidate_game_state
+from trivia_api.engine import GameEngine
+from trivia_api.lobby import send_player_count
+from trivia_api.metrics import measure, view_seconds
+from trivia_api.middlewares import get_cached_user, get_claims
+from trivia_api.models import Game, Membership
+from trivia_api.states import cached_game_state, game_state_etag
+
+# messages still being sent after their response went out
+_background = set()
+
+
+async def authenticate(request):
+    # same access tokens as JWTAuthentication, through the middleware's claims and user caches
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+
+    claims = get_claims(parts[1])
+    if claims is None or claims.get(api_settings.TOKEN_TYPE_CLAIM) != 'access':
+        return None
+
+    user = await get_cached_user(claims.get(api_settings.USER_ID_CLAIM))
+    # JWTAuthentication rejects inactive users too
+    return user if user.is_authenticated and user.is_active else None
+
+
+def in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def broadcast(game_id, message):
+    in_background(GameEngine(game_id).broadcast(message))
+
+
+def game_view(queryset):
+    # POST only, authenticated, with the game looked up in queryset like GameViewSet.get_object
+    def decorator(view):
+        async def wrapper(request, pk):
+            with measure(view_seconds, view.__name__):
+                return await dispatch(request, pk)
+
+        async def dispatch(request, pk):
+            if request.method != 'POST':
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+            user = await authenticate(request)
+            if user is None:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                                    status=status.HTTP_401_UNAUTHORIZED)
+
+            game = await queryset.filter(pk=pk).afirst()
+            if game is None:
+                return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+            return await view(request, user, game)
+
+        # csrf_exempt() would wrap the coroutine in a sync view before Django 5.0
+        wrapper.csrf_exempt = True
+        return wraps(view)(wrapper)
+    return decorator
+
+
+@game_view(Game.open.all())
+async def join_game(request, user, game):
+    if game.is_open:
+        # one INSERT ... ON CONFLICT DO NOTHING instead of players.add()'s lookup and insert
+        await Membership.objects.abulk_create([Membership(game=game, player=user)], ignore_conflicts=True)
+        await game.abump_version()
+        invalidate_game_state(game.id)
+
+        broadcast(game.id, {'type': 'player_joined',
+                            'userid': user.id,
+                            'username': user.username})
+        in_background(send_player_count(game.id))
+
+        return JsonResponse(
+            data={
+                "message": "Te has unido correctamente al juego.",
+                "game_id": game.id,
+            },
+            status=status.HTTP_200_OK
+        )
+    else:
+        return JsonResponse(
+            data={
+                "message": "El juego ya comenzó, no permite inscripción.",
+                "game_id": game.id,
+            },
+            status=status.HTTP_423_LOCKED
+        )
+
+
+@game_view(Game.open.all())
+async def unjoin_game(request, user, game):
+    if game.is_open:
+        if game.creator_id != user.id:
+            deleted, _ = await Membership.objects.filter(game=game, player=user).adelete()
+            if deleted:
+                await game.abump_version()
+                invalidate_game_state(game.id)
+
+                broadcast(game.id, {'type': 'player_unjoined',
+                                    'userid': user.id,
+                                    'username': user.username})
+                in_background(send_player_count(game.id))
+
+                return JsonResponse(
+                    data={
+                        "message": "Te has desvinculado correctamente del juego.",
+                        "game_id": game.id,
+                    },
+                    status=status.HTTP_200_OK
+                )
+            else:
+                return JsonResponse(
+                    data={
+                        "message": "El usuario que se quiere desvincular no está inscrito en el juego.",
+                        "game_id": game.id,
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            return JsonResponse(
+                data={
+                    "message": "El crador del juego no puede desvincularse.",
+                    "game_id": game.id,
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    else:
+        return JsonResponse(
+            data={
+                "message": "El juego ya comenzó, no permite desvinculare.",
+                "game_id": game.id,
+            },
+            status=status.HTTP_423_LOCKED
+        )
+
+
+@game_view(Game.objects.all())
+async def state(request, user, game):
+    if not game.is_open:
+        etag = game_state_etag(game)
+        if etag in request.headers.get('If-None-Match', ''):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        return JsonResponse(
+            data=await sync_to_async(cached_game_state)(game),
+            status=status.HTTP_200_OK,
+            headers={'ETag': etag}
+        )
+    else:
+        return JsonResponse(
+            data={
+                "message": "El juego aun no ha comenzado.",
+                "game_id": game.id,
+            },
+            status=status.HTTP_423_LOCKED
+        )
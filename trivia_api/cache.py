@@ -0,0 +1,82 @@
+import threading
+import uuid
+
+from channels.db import database_sync_to_async
+from django.db.models import OuterRef
+
+# identifies this worker in broadcasts, so consumers only drop their cached state
+# for changes made by other processes
+PROCESS_ID = uuid.uuid4().hex
+
+
+# In-process snapshot of a game (config, player count, current round and nosy) shared by the
+# consumers of this worker. Kept up to date by the consumer's own writes; any other
+# writer must call invalidate_game_state.
+class GameState:
+    def __init__(self, game, c_round):
+        self.game = game
+        self.round = c_round
+
+    @classmethod
+    def load(cls, game_id):
+        from trivia_api.models import Game, Membership, count_of
+
+        # game, creator, current round, nosy and player count in one query
+        game = Game.objects.select_related('creator', 'current_round__nosy').annotate(
+            memberships_count=count_of(Membership.objects.filter(game=OuterRef('pk'))),
+        ).get(id=game_id)
+
+        c_round = game.current_round
+        if c_round is not None:
+            c_round.game = game
+
+        return cls(game, c_round)
+
+    @property
+    def creator(self):
+        return self.game.creator
+
+    @property
+    def is_open(self):
+        return self.game.is_open
+
+    @property
+    def players_count(self):
+        return self.game.memberships_count
+
+    @property
+    def nosy(self):
+        return self.round.nosy if self.round is not None else None
+
+    @property
+    def round_number(self):
+        return self.round.number if self.round is not None else 0
+
+    def set_round(self, c_round):
+        self.round = c_round
+
+
+_states = {}
+_lock = threading.Lock()
+
+
+def get_game_state(game_id):
+    state = _states.get(game_id)
+    if state is None:
+        state = GameState.load(game_id)
+        with _lock:
+            state = _states.setdefault(game_id, state)
+    return state
+
+
+def invalidate_game_state(game_id):
+    with _lock:
+        _states.pop(game_id, None)
+
+
+async def aget_game_state(game_id):
+    # a cached state is returned without leaving the event loop
+    state = _states.get(game_id)
+    if state is None:
+        state = await database_sync_to_async(get_game_state)(game_id)
+    return state
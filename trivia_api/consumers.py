@@ -1,68 +1,108 @@
-import asyncio
-import traceback
-
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.db.models import F
+
+from trivia_api.cache import PROCESS_ID, aget_game_state, get_game_state, invalidate_game_state
+from trivia_api.engine import GameEngine
+from trivia_api.journal import events_since
+from trivia_api.lobby import LOBBY_GROUP, lobby_games, send_lobby
+from trivia_api.metrics import action_seconds, measure, open_sockets
+from trivia_api.orchestrator import start_orchestrator
+from trivia_api.spectators import snapshot_text, start_spectator_feed
 
 import datetime
+from urllib.parse import parse_qs
 
 
 class TriviaConsumer(AsyncJsonWebsocketConsumer):
-    DELTA_TIME = 2
-    START_TIME = 5
-    QUALIFY_TIME = 90
-    ASSESS_TIME = 30
+    last_seq = 0
 
     async def connect(self):
         self.game_id = self.scope["url_route"]["kwargs"]["game_id"]
+        self.engine = GameEngine(self.game_id, self.channel_layer)
+        start_orchestrator()
 
         # Verify is joined
         if await self.verify_player():
             self.group_name = f'game_{self.game_id}'
+            self.user_group_name = self.engine.user_group(self.scope['user'].id)
 
             await self.channel_layer.group_add(self.group_name, self.channel_name)
+            await self.channel_layer.group_add(self.user_group_name, self.channel_name)
             await self.accept()
+            open_sockets.inc('trivia')
+
+            # a socket that reconnects with ?last_seq= gets the events it missed
+            last_seq = parse_qs(self.scope['query_string'].decode()).get('last_seq')
+            if last_seq is not None and last_seq[0].isdigit():
+                await self.resume(int(last_seq[0]))
 
     async def disconnect(self, close_code):
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+            open_sockets.dec('trivia')
 
     async def receive_json(self, content=None):
-        print(f'{self.scope["user"]} -> {content}`')
-        if content['action'] == 'start':
-            await self.action_start(int(content['rounds']))
-        elif content['action'] == 'question':
-            await self.action_question(content['text'])
-        elif content['action'] == 'answer':
-            await self.action_answer(content['text'])
-        elif content['action'] == 'qualify':
-            await self.action_qualify(int(content['userid']), int(content['grade']))
-        elif content['action'] == 'assess':
-            await self.action_assess(content['correctness'] == 'true')
+        with measure(action_seconds) as timing:
+            if content['action'] == 'start':
+                timing.name = 'start'
+                await self.action_start(int(content['rounds']))
+            elif content['action'] == 'question':
+                timing.name = 'question'
+                await self.action_question(content['text'])
+            elif content['action'] == 'answer':
+                timing.name = 'answer'
+                await self.action_answer(content['text'])
+            elif content['action'] == 'qualify':
+                timing.name = 'qualify'
+                await self.action_qualify(int(content['userid']), int(content['grade']))
+            elif content['action'] == 'assess':
+                timing.name = 'assess'
+                await self.action_assess(content['correctness'] == 'true')
 
     async def game_message(self, event):
         message = event["message"]
 
-        if 'userid' not in event or event['userid'] == self.scope['user'].id:
-            await self.send_json(content=message)
+        if event.get('origin') != PROCESS_ID:
+            invalidate_game_state(self.game_id)
+
+        seq = event.get('seq')
+        if seq is not None:
+            if seq <= self.last_seq:
+                # already sent by resume
+                return
+            message = dict(message, seq=seq)
+
+        await self.send_json(content=message)
+
+    async def resume(self, last_seq):
+        events = await events_since(self.game_id, last_seq, self.scope['user'].id)
+
+        if events is None:
+            # too old for the journal, the client has to reload the game state
+            await self.send_json(content={'type': 'resync'})
+        else:
+            for seq, message in events:
+                await self.send_json(content=dict(message, seq=seq))
+            self.last_seq = events[-1][0] if events else last_seq
 
     async def action_start(self, rounds=None):
-        creator, is_open, player_count = await self.get_game_params()
-
-        if self.scope['user'].id == creator.id:
-            if player_count > 2:
-                if is_open:
-                    if rounds is not None and rounds >= player_count:
-                        players = await self.start_game(rounds)
-                        await self.channel_layer.group_send(
-                            self.group_name, {"type": "game_message", "message": {
-                                'type': 'game_started',
-                                'rounds': rounds,
-                                'players': players,
-                            }}
-                        )
-
-                        self.start_timer_task = asyncio.create_task(self.game_start_timer())
+        state = await aget_game_state(self.game_id)
+
+        if self.scope['user'].id == state.creator.id:
+            if state.players_count > 2:
+                if state.is_open:
+                    if rounds is not None and rounds >= state.players_count:
+                        players = await self.start_game(state, rounds)
+                        await self.engine.broadcast({
+                            'type': 'game_started',
+                            'rounds': rounds,
+                            'players': players,
+                        })
+                        await send_lobby({'type': 'game_started', 'game': self.game_id}, self.channel_layer)
+
+                        await self.engine.set_timer('start', self.engine.START_TIME)
                     else:
                         error_message = 'El número de rondas debe ser mayor o igual al número de jugadores'
                         await self.send_json(content={
@@ -93,20 +133,18 @@ class TriviaConsumer(AsyncJsonWebsocketConsumer):
             await self.create_error("start", error_message)
 
     async def action_question(self, q_text):
-        creator, is_open, player_count = await self.get_game_params()
+        state = await aget_game_state(self.game_id)
 
-        if not is_open:
-            round, nosy = await self.get_current_round()
+        if not state.is_open:
+            round, nosy = state.round, state.nosy
             if self.scope['user'].id == nosy.id:
                 if round.question_arrived is None:
-                    await self.save_question(q_text)
-                    await self.channel_layer.group_send(
-                        self.group_name, {"type": "game_message", "message": {
-                            'type': 'round_question',
-                            'question': q_text,
-                        }}
-                    )
-                    self.answer_timer_task = asyncio.create_task(self.round_answer_timer())
+                    await self.save_question(round, q_text)
+                    await self.engine.broadcast({
+                        'type': 'round_question',
+                        'question': q_text,
+                    })
+                    await self.engine.set_timer('answer', state.game.answer_time + self.engine.DELTA_TIME)
                 else:
                     error_message = 'Ya se entregó la pregunta de esta ronda'
                     await self.send_json(content={
@@ -130,24 +168,22 @@ class TriviaConsumer(AsyncJsonWebsocketConsumer):
             await self.create_error("question", error_message)
 
     async def action_answer(self, a_text):
-        creator, is_open, player_count = await self.get_game_params()
+        state = await aget_game_state(self.game_id)
 
-        if not is_open:
-            round, nosy = await self.get_current_round()
+        if not state.is_open:
+            round, nosy = state.round, state.nosy
 
             if round.question_arrived is not None:
                 if round.answer_ended is None:
-                    move = await self.save_answer(a_text)
+                    move = await self.save_answer(round, a_text)
 
                     if move is not None:
                         if self.scope['user'].id != nosy.id:
-                            await self.channel_layer.group_send(
-                                self.group_name, {"type": "game_message", 'userid': nosy.id, "message": {
-                                    'type': 'round_answer',
-                                    'answer': a_text,
-                                    'userid': self.scope['user'].id,
-                                }}
-                            )
+                            await self.engine.send_to_user(nosy.id, {
+                                'type': 'round_answer',
+                                'answer': a_text,
+                                'userid': self.scope['user'].id,
+                            })
                     else:
                         error_message = 'No se puede cambiar la respuesta previamente enviada'
                         await self.send_json(content={
@@ -178,13 +214,13 @@ class TriviaConsumer(AsyncJsonWebsocketConsumer):
             await self.create_error("answer", error_message)
 
     async def action_qualify(self, userid, grade):
-        creator, is_open, player_count = await self.get_game_params()
+        state = await aget_game_state(self.game_id)
 
-        if not is_open:
-            round, nosy = await self.get_current_round()
+        if not state.is_open:
+            round, nosy = state.round, state.nosy
             if self.scope['user'].id == nosy.id:
                 if round.qualify_ended is None:
-                    status = await self.save_answer_evaluation(userid, grade)
+                    status, qs_data = await self.save_answer_evaluation(round, userid, grade)
 
                     if not status:
                         error_message = 'Este usuario no ha enviado una respuesta para ser evaluada'
@@ -193,11 +229,8 @@ class TriviaConsumer(AsyncJsonWebsocketConsumer):
                             'message': error_message
                         })
                         await self.create_error("qualify", error_message)
-                    else:
-                        qualify_ready = await self.check_qualify_status()
-                        if qualify_ready:
-                            qs_data = await self.qualify_ended()
-                            await self.send_qualifications(qs_data)
+                    elif qs_data is not None:
+                        await self.engine.send_qualifications(qs_data)
                 else:
                     error_message = 'Ya no se aceptan calificaciones'
                     await self.send_json(content={
@@ -221,12 +254,12 @@ class TriviaConsumer(AsyncJsonWebsocketConsumer):
             await self.create_error("qualify", error_message)
 
     async def action_assess(self, is_correct):
-        creator, is_open, player_count = await self.get_game_params()
+        state = await aget_game_state(self.game_id)
 
-        if not is_open:
-            round, nosy = await self.get_current_round()
+        if not state.is_open:
+            round, nosy = state.round, state.nosy
             if round.qualify_ended is not None and round.ended is None:
-                status = await self.save_assess(self.scope['user'].id, is_correct)
+                status = await self.save_assess(round, self.scope['user'].id, is_correct)
 
                 if not status:
                     error_message = 'No hay una evaluación activa para este usuario'
@@ -250,454 +283,127 @@ class TriviaConsumer(AsyncJsonWebsocketConsumer):
             })
             await self.create_error("assess", error_message)
 
-    async def start_round_message(self, round_number, nosy_id):
-        await self.channel_layer.group_send(
-            self.group_name, {"type": "game_message", "message": {
-                'type': 'round_started',
-                'round_number': round_number,
-                'nosy_id': nosy_id,
-            }}
-        )
-        self.question_timer_task = asyncio.create_task(self.round_question_timer())
-
-    async def send_qualifications(self, qualifications_data):
-        for q in qualifications_data:
-            await self.channel_layer.group_send(
-                self.group_name, {"type": "game_message", 'userid': q['userid'], "message": {
-                    'type': 'round_review_answer',
-                    'correct_answer': q['correct_answer'],
-                    'graded_answer': q['graded_answer'],
-                    'grade': q['grade'],
-                }}
-            )
-
-        self.assess_timer_task = asyncio.create_task(self.round_assess_timer())
-
-    async def finish_round(self):
-        round_result, game_scores = await self.get_round_results()
-        await self.channel_layer.group_send(
-            self.group_name, {"type": "game_message", "message": {
-                'type': 'round_result',
-                'round_results': round_result,
-                'game_scores': game_scores,
-            }}
-        )
-
-        if await self.check_active_players():
-            round_number, nosy_id = await self.next_round()
-            if round_number is not None:
-                await self.start_round_message(round_number, nosy_id)
-            else:
-                await self.finish_game()
-                await self.channel_layer.group_send(
-                    self.group_name, {"type": "game_message", "message": {
-                        'type': 'game_result',
-                        'game_scores': game_scores,
-                    }}
-                )
-        else:
-            await self.cancel_game()
-
-    async def cancel_game(self):
-        await self.finish_game()
-        await self.send_canceled_message()
-
-    async def send_fault(self, player_id, category, is_disqualified):
-        await self.channel_layer.group_send(
-            self.group_name, {"type": "game_message", "message": {
-                'type': 'user_fault',
-                'player_id': player_id,
-                'category': category,
-            }}
-        )
-
-        if is_disqualified:
-            await self.channel_layer.group_send(
-                self.group_name, {"type": "game_message", "message": {
-                    'type': 'user_disqualified',
-                    'player_id': player_id,
-                }}
-            )
-
-    async def send_canceled_message(self):
-        round_result, game_scores = await self.get_round_results()
-        await self.channel_layer.group_send(
-            self.group_name, {"type": "game_message", "message": {
-                'type': 'game_canceled',
-                'message': 'El juego se cancela porque quedan menos de 3 jugadores activos',
-                'game_scores': game_scores,
-            }}
-        )
-
-    @database_sync_to_async
-    def check_active_players(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        return len(game.active_players) >= 3
-
-    @database_sync_to_async
-    def verify_player(self):
+    async def verify_player(self):
         if self.scope['user'].is_anonymous:
             return False
         else:
-            return self.scope['user'].games.filter(id=self.game_id).exists()
-
-    @database_sync_to_async
-    def get_game_base(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        return game
-
-    @database_sync_to_async
-    def get_game_params(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        return game.creator, game.is_open, game.players_count
+            return await self.scope['user'].games.filter(id=self.game_id).aexists()
 
-    @database_sync_to_async
-    def start_game(self, rounds):
+    async def start_game(self, state, rounds):
         from trivia_api.models import Game
 
-        game = Game.objects.get(id=self.game_id)
-        game.started = datetime.datetime.now()
-        game.rounds_number = rounds
-        game.save()
-
-        return [{'username': p.username, 'userid': p.id} for p in game.players.all()]
-
-    @database_sync_to_async
-    def finish_game(self):
-        from trivia_api.models import Game
+        players = [{'username': p.username, 'userid': p.id} async for p in state.game.players.all()]
 
-        game = Game.objects.get(id=self.game_id)
-        game.ended = datetime.datetime.now()
-        game.save()
+        started = datetime.datetime.now()
+        nosy_plan = state.game.plan_nosies([p['userid'] for p in players])
+        await Game.objects.filter(id=self.game_id).aupdate(started=started,
+                                                           rounds_number=rounds,
+                                                           nosy_plan=nosy_plan,
+                                                           version=F('version') + 1)
+        state.game.started = started
+        state.game.rounds_number = rounds
 
-    @database_sync_to_async
-    def next_round(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        if game.next_round():
-            return game.rounds.count(), game.current_round.nosy.id
-        else:
-            return None, None
+        return players
 
     @database_sync_to_async
-    def get_current_round(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
-        if round is None:
-            return None
-        else:
-            return round, round.nosy
-
-    @database_sync_to_async
-    def save_question(self, q_text):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
+    def save_question(self, round, q_text):
         round.question = q_text
         round.question_arrived = datetime.datetime.now()
         round.save()
 
     @database_sync_to_async
-    def save_answer(self, a_text):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
+    def save_answer(self, round, a_text):
         move = round.add_answer(self.scope['user'], a_text)
 
         return move
 
     @database_sync_to_async
-    def restart_round(self):
-        from trivia_api.models import Game
-        game = Game.objects.get(id=self.game_id)
-
-        game.restart_round()
-
-        return game.rounds.count(), game.current_round.nosy
-
-    @database_sync_to_async
-    def answer_ended(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        c_round = game.current_round
-        c_round.answer_ended = datetime.datetime.now()
-        c_round.save()
-
-    @database_sync_to_async
-    def qualify_ended(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        c_round = game.current_round
-        c_round.qualify_ended = datetime.datetime.now()
-        c_round.save()
-
-        c_round.create_qualifications()
-
-        return [{'userid': q.player.id,
-                 'correct_answer': c_round.correct_answer,
-                 'graded_answer': q.move.answer,
-                 'grade': q.move.evaluation
-                 } for q in c_round.qualifications.all()]
-
-    @database_sync_to_async
-    def asses_ended(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        c_round = game.current_round
-        c_round.ended = datetime.datetime.now()
-        c_round.save()
-
-    @database_sync_to_async
-    def save_answer_evaluation(self, userid, grade):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
+    def save_answer_evaluation(self, round, userid, grade):
+        # the evaluation, the qualify check and the qualifications share one hop
         status = round.add_answer_evaluation(userid, grade)
 
-        return status
+        if status and round.answer_ended is not None and len(round.missing_evaluations) == 0:
+            return status, self.engine.end_qualify(round)
+        return status, None
 
-    @database_sync_to_async
-    def get_players_without_move(self):
-        from trivia_api.models import Game
+    async def save_assess(self, round, userid, is_correct):
+        from trivia_api.models import Qualification
 
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
-        return round.missing_players
+        updated = await Qualification.objects.filter(player__id=userid, move__round=round) \
+            .aupdate(is_correct=is_correct, qualified=datetime.datetime.now())
 
-    @database_sync_to_async
-    def get_missing_evaluations(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
-        return round.missing_evaluations
-
-    @database_sync_to_async
-    def get_missing_qualifications(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        c_round = game.current_round
-        return c_round.missing_qualifications_players
-
-    @database_sync_to_async
-    def check_qualify_status(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
-
-        if round.answer_ended is not None and len(round.missing_evaluations) == 0:
-            return True
-        return False
-
-    @database_sync_to_async
-    def close_evaluations(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
-        round.close_evaluations()
-
-    @database_sync_to_async
-    def save_assess(self, userid, is_correct):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        round = game.current_round
-        qualification = round.get_qualification(userid)
-
-        if qualification is not None:
-            qualification.is_correct = is_correct
-            qualification.qualified = datetime.datetime.now()
-            qualification.save()
-            return True
-        else:
-            return False
-
-    @database_sync_to_async
-    def get_round_results(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        c_round = game.current_round
-        round_result = c_round.get_results()
-        game_scores = game.get_scores()
-
-        return round_result, game_scores
-
-    @database_sync_to_async
-    def create_nosy_fault(self, category):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        c_round = game.current_round
-        fault = c_round.create_fault(c_round.nosy.id, category)
-        is_disqualified = game.is_disqualified(c_round.nosy.id)
-        return fault.player.id, fault.category, is_disqualified
-
-    @database_sync_to_async
-    def create_fault(self, player_id, category):
-        from trivia_api.models import Game
-
-        try:
-            game = Game.objects.get(id=self.game_id)
-            c_round = game.current_round
-            fault = c_round.create_fault(player_id, category)
-            is_disqualified = game.is_disqualified(player_id)
-        except Exception as e:
-            print(e)
-
-        return fault.player.id, fault.category, is_disqualified
-
-    @database_sync_to_async
-    def get_moves_count(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        return game.current_round.moves_count
-
-    @database_sync_to_async
-    def get_round_index(self):
-        from trivia_api.models import Game
-
-        game = Game.objects.get(id=self.game_id)
-        return game.current_round.index
+        return updated > 0
 
     @database_sync_to_async
     def create_error(self, action, error_message):
-        from trivia_api.models import Game, ActionError
-        from django.contrib.auth.models import User
-
-        game = Game.objects.get(id=self.game_id)
-        c_round = game.current_round
-
-        ActionError.objects.create(player=self.scope["user"],
-                                   round=c_round,
-                                   action=action,
-                                   error_message=error_message)
-
-    async def game_start_timer(self):
-        await asyncio.sleep(self.START_TIME)
-
-        round_number, nosy_id = await self.next_round()
-        await self.start_round_message(round_number, nosy_id)
-
-    async def round_question_timer(self):
-        game = await self.get_game_base()
-
-        await asyncio.sleep(game.question_time + self.DELTA_TIME)
-        c_round, nosy = await self.get_current_round()
-
-        if c_round.question is None:
-            await self.channel_layer.group_send(
-                self.group_name, {"type": "game_message", "message": {
-                    'type': 'question_time_ended',
-                }}
-            )
-            player_id, category, is_disqualified = await self.create_nosy_fault('QT')
-            await self.send_fault(player_id, category, is_disqualified)
-
-            if await self.check_active_players():
-                round_number, nosy = await self.restart_round()
-                await self.start_round_message(round_number, nosy.id)
-            else:
-                await self.cancel_game()
-
-    async def round_answer_timer(self):
-        game = await self.get_game_base()
-
-        await asyncio.sleep(game.answer_time + self.DELTA_TIME)
-
-        await self.channel_layer.group_send(
-            self.group_name, {"type": "game_message", "message": {
-                'type': 'answer_time_ended',
-            }}
-        )
-
-        await self.answer_ended()
+        from trivia_api.models import ActionError
 
-        missing_players = await self.get_players_without_move()
+        c_round = get_game_state(self.game_id).round
 
-        for p in missing_players:
-            player_id, category, is_disqualified = await self.create_fault(p.id, 'AT')
-            await self.send_fault(player_id, category, is_disqualified)
-
-        # TODO: check si hay respuestas
-        moves_count = await self.get_moves_count()
-        if moves_count == 0:
-            try:
-                await self.qualify_ended()
-                await self.asses_ended()
-                await self.finish_round()
-            except Exception:
-                traceback.print_exc()
+        if c_round is not None:
+            c_round.create_error(self.scope["user"], action, error_message)
         else:
-            await self.round_qualify_timer()
+            ActionError.objects.create(player=self.scope["user"],
+                                       action=action,
+                                       error_message=error_message)
 
-    async def round_qualify_timer(self):
-        missing_evaluations = await self.get_missing_evaluations()
 
-        if len(missing_evaluations) > 0:
-            round_idx = await self.get_round_index()
+class LobbyConsumer(AsyncJsonWebsocketConsumer):
+    # open games: a snapshot on connect, then the deltas sent by trivia_api.lobby
+    async def connect(self):
+        if not self.scope['user'].is_anonymous:
+            self.group_name = LOBBY_GROUP
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+            await self.accept()
+            open_sockets.inc('lobby')
+            await self.send_json(content={
+                'type': 'lobby_games',
+                'games': await database_sync_to_async(lobby_games)(),
+            })
 
-            await asyncio.sleep(self.QUALIFY_TIME + self.DELTA_TIME)
-            round_idx_post = await self.get_round_index()
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            open_sockets.dec('lobby')
 
-            if round_idx == round_idx_post:
-                missing_evaluations = await self.get_missing_evaluations()
-                if len(missing_evaluations) > 0:
-                    await self.channel_layer.group_send(
-                        self.group_name, {"type": "game_message", "message": {
-                            'type': 'qualify_timeout',
-                        }}
-                    )
-                    await self.close_evaluations()
+    async def lobby_message(self, event):
+        await self.send_json(content=event["message"])
 
-                    player_id, category, is_disqualified = await self.create_nosy_fault('ET')
-                    await self.send_fault(player_id, category, is_disqualified)
 
-                    qs_data = await self.qualify_ended()
-                    await self.send_qualifications(qs_data)
-        else:
-            try:
-                qs_data = await self.qualify_ended()
-                await self.send_qualifications(qs_data)
-            except Exception as e:
-                print(e)
-                raise e
+class SpectatorConsumer(AsyncJsonWebsocketConsumer):
+    # read only: the game snapshot on connect, then at most one per tick while the game changes
+    async def connect(self):
+        self.game_id = self.scope["url_route"]["kwargs"]["game_id"]
 
-    async def round_assess_timer(self):
-        await asyncio.sleep(self.ASSESS_TIME + self.DELTA_TIME)
+        if not self.scope['user'].is_anonymous:
+            feed = start_spectator_feed()
+            group_name = feed.group(self.game_id)
 
-        await self.channel_layer.group_send(
-            self.group_name, {"type": "game_message", "message": {
-                'type': 'assess_timeout',
-            }}
-        )
+            # in the group before the snapshot is read, so no later change is missed
+            await self.channel_layer.group_add(group_name, self.channel_name)
+            snapshot = await self.get_snapshot()
+            if snapshot is None:
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+                return
 
-        await self.asses_ended()
+            self.feed, self.group_name = feed, group_name
+            self.feed.watch(self.game_id, snapshot[0])
+            await self.accept()
+            open_sockets.inc('spectator')
+            await self.send(text_data=snapshot[1])
 
-        missing_players = await self.get_missing_qualifications()
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            self.feed.unwatch(self.game_id)
+            open_sockets.dec('spectator')
 
-        for p in missing_players:
-            player_id, category, is_disqualified = await self.create_fault(p.id, 'FT')
-            await self.send_fault(player_id, category, is_disqualified)
+    async def spectator_message(self, event):
+        await self.send(text_data=event["text"])
 
-        await self.finish_round()
+    @database_sync_to_async
+    def get_snapshot(self):
+        from trivia_api.models import Game
 
+        game = Game.objects.filter(id=self.game_id).select_related('current_round').first()
+        return (game.version, snapshot_text(game)) if game is not None else None
@@ -0,0 +1,368 @@
+import datetime
+import traceback
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+from trivia_api.cache import PROCESS_ID, get_game_state, invalidate_game_state
+from trivia_api.journal import record
+from trivia_api.layers import group_send_many
+from trivia_api.metrics import channel_sends, measure, timer_seconds
+
+
+class GameEngine:
+    # Drives the phases of a game: round transitions, timeouts, faults and the
+    # messages that announce them. Timers are stored on the game (Game.timer and
+    # Game.deadline) and fired by the orchestrator, so a game keeps going no matter
+    # which socket or process started a phase.
+    DELTA_TIME = 2
+    START_TIME = 5
+    QUALIFY_TIME = 90
+    ASSESS_TIME = 30
+
+    # A game has a single timer, so a phase timer is only set while the current round
+    # is still in that phase: a late set_timer must not replace the next phase's timer.
+    PHASE_FILTERS = {
+        'answer': {'current_round__answer_ended__isnull': True},
+        'qualify': {'current_round__qualify_ended__isnull': True},
+        'assess': {'current_round__ended__isnull': True},
+    }
+
+    def __init__(self, game_id, channel_layer=None):
+        self.game_id = game_id
+        self.group_name = f'game_{game_id}'
+        self.channel_layer = channel_layer if channel_layer is not None else get_channel_layer()
+
+    def user_group(self, user_id):
+        return f'{self.group_name}_user_{user_id}'
+
+    def event(self, message, seq):
+        return {"type": "game_message", "origin": PROCESS_ID, "seq": seq, "message": message}
+
+    async def broadcast(self, message):
+        seq, = await record(self.game_id, [(None, message)])
+        channel_sends.inc('game')
+        await self.channel_layer.group_send(self.group_name, self.event(message, seq))
+
+    async def send_to_user(self, user_id, message):
+        seq, = await record(self.game_id, [(user_id, message)])
+        channel_sends.inc('user')
+        await self.channel_layer.group_send(self.user_group(user_id), self.event(message, seq))
+
+    async def send_to_users(self, messages):
+        # messages maps each user id to the message only that user has to receive
+        seqs = await record(self.game_id, list(messages.items()))
+        group_messages = [(self.user_group(user_id), self.event(m, seq))
+                          for (user_id, m), seq in zip(messages.items(), seqs)]
+        channel_sends.inc('user', amount=len(group_messages))
+
+        await group_send_many(self.channel_layer, group_messages)
+
+    async def set_timer(self, timer, seconds):
+        from trivia_api.orchestrator import wake_orchestrator
+
+        deadline = await self.save_timer(timer, seconds)
+        if deadline is not None:
+            wake_orchestrator(deadline)
+
+    async def on_timer(self, timer):
+        # the game may have been changed by another process since it was cached here
+        invalidate_game_state(self.game_id)
+
+        with measure(timer_seconds, timer):
+            if timer == 'start':
+                await self.game_start_timeout()
+            elif timer == 'question':
+                await self.round_question_timeout()
+            elif timer == 'answer':
+                await self.round_answer_timeout()
+            elif timer == 'qualify':
+                await self.round_qualify_timeout()
+            elif timer == 'assess':
+                await self.round_assess_timeout()
+
+    async def start_round_message(self, round_number, nosy_id):
+        await self.broadcast({
+            'type': 'round_started',
+            'round_number': round_number,
+            'nosy_id': nosy_id,
+        })
+        game = await self.get_game_base()
+        await self.set_timer('question', game.question_time + self.DELTA_TIME)
+
+    async def send_qualifications(self, qualifications_data):
+        await self.send_to_users({q['userid']: {
+            'type': 'round_review_answer',
+            'correct_answer': q['correct_answer'],
+            'graded_answer': q['graded_answer'],
+            'grade': q['grade'],
+        } for q in qualifications_data})
+
+        await self.set_timer('assess', self.ASSESS_TIME + self.DELTA_TIME)
+
+    async def finish_round(self):
+        round_result, game_scores = await self.get_round_results()
+        await self.broadcast({
+            'type': 'round_result',
+            'round_results': round_result,
+            'game_scores': game_scores,
+        })
+
+        if await self.check_active_players():
+            round_number, nosy_id = await self.next_round()
+            if round_number is not None:
+                await self.start_round_message(round_number, nosy_id)
+            else:
+                await self.finish_game()
+                await self.broadcast({
+                    'type': 'game_result',
+                    'game_scores': game_scores,
+                })
+        else:
+            await self.cancel_game()
+
+    async def cancel_game(self):
+        await self.finish_game()
+        await self.send_canceled_message()
+
+    async def send_fault(self, player_id, category, is_disqualified):
+        await self.broadcast({
+            'type': 'user_fault',
+            'player_id': player_id,
+            'category': category,
+        })
+
+        if is_disqualified:
+            await self.broadcast({
+                'type': 'user_disqualified',
+                'player_id': player_id,
+            })
+
+    async def fault_players(self, players, category):
+        if len(players) > 0:
+            player_ids, disqualified_ids = await self.create_faults([p.id for p in players], category)
+            await self.send_faults(category, player_ids, disqualified_ids)
+
+    async def send_faults(self, category, player_ids, disqualified_ids):
+        await self.broadcast({
+            'type': 'user_faults',
+            'category': category,
+            'player_ids': player_ids,
+            'disqualified_ids': disqualified_ids,
+        })
+
+    async def send_canceled_message(self):
+        round_result, game_scores = await self.get_round_results()
+        await self.broadcast({
+            'type': 'game_canceled',
+            'message': 'El juego se cancela porque quedan menos de 3 jugadores activos',
+            'game_scores': game_scores,
+        })
+
+    async def game_start_timeout(self):
+        round_number, nosy_id = await self.next_round()
+        await self.start_round_message(round_number, nosy_id)
+
+    async def round_question_timeout(self):
+        c_round, nosy = await self.get_current_round()
+
+        if c_round.question is None:
+            await self.broadcast({
+                'type': 'question_time_ended',
+            })
+            player_id, category, is_disqualified = await self.create_nosy_fault('QT')
+            await self.send_fault(player_id, category, is_disqualified)
+
+            if await self.check_active_players():
+                round_number, nosy = await self.restart_round()
+                await self.start_round_message(round_number, nosy.id)
+            else:
+                await self.cancel_game()
+
+    async def round_answer_timeout(self):
+        # saved before the message, which makes other processes reload the round
+        await self.answer_ended()
+
+        await self.broadcast({
+            'type': 'answer_time_ended',
+        })
+
+        missing_players = await self.get_players_without_move()
+        await self.fault_players(missing_players, 'AT')
+
+        moves_count = await self.get_moves_count()
+        if moves_count == 0:
+            try:
+                await self.qualify_ended()
+                await self.asses_ended()
+                await self.finish_round()
+            except Exception:
+                traceback.print_exc()
+        else:
+            missing_evaluations = await self.get_missing_evaluations()
+
+            if len(missing_evaluations) > 0:
+                await self.set_timer('qualify', self.QUALIFY_TIME + self.DELTA_TIME)
+            else:
+                qs_data = await self.qualify_ended()
+                await self.send_qualifications(qs_data)
+
+    async def round_qualify_timeout(self):
+        missing_evaluations = await self.get_missing_evaluations()
+        if len(missing_evaluations) > 0:
+            await self.broadcast({
+                'type': 'qualify_timeout',
+            })
+            await self.close_evaluations()
+
+            player_id, category, is_disqualified = await self.create_nosy_fault('ET')
+            await self.send_fault(player_id, category, is_disqualified)
+
+            qs_data = await self.qualify_ended()
+            await self.send_qualifications(qs_data)
+        else:
+            # every answer was graded but the qualify phase was never closed
+            c_round, _ = await self.get_current_round()
+            if c_round.qualify_ended is None:
+                qs_data = await self.qualify_ended()
+                await self.send_qualifications(qs_data)
+
+    async def round_assess_timeout(self):
+        await self.broadcast({
+            'type': 'assess_timeout',
+        })
+
+        await self.asses_ended()
+
+        missing_players = await self.get_missing_qualifications()
+        await self.fault_players(missing_players, 'FT')
+
+        await self.finish_round()
+
+    @database_sync_to_async
+    def save_timer(self, timer, seconds):
+        from trivia_api.models import Game
+
+        deadline = timezone.now() + datetime.timedelta(seconds=seconds)
+        updated = Game.objects.filter(id=self.game_id, **self.PHASE_FILTERS.get(timer, {})) \
+            .update(timer=timer, deadline=deadline)
+        return deadline if updated else None
+
+    @database_sync_to_async
+    def check_active_players(self):
+        state = get_game_state(self.game_id)
+        return len(state.game.active_players) >= 3
+
+    @database_sync_to_async
+    def get_game_base(self):
+        return get_game_state(self.game_id).game
+
+    @database_sync_to_async
+    def get_current_round(self):
+        state = get_game_state(self.game_id)
+        if state.round is None:
+            return None
+        else:
+            return state.round, state.nosy
+
+    @database_sync_to_async
+    def finish_game(self):
+        game = get_game_state(self.game_id).game
+        game.ended = datetime.datetime.now()
+        game.timer = None
+        game.deadline = None
+        game.save(update_fields=['ended', 'timer', 'deadline'])
+
+        invalidate_game_state(self.game_id)
+
+    @database_sync_to_async
+    def next_round(self):
+        state = get_game_state(self.game_id)
+        c_round = state.game.next_round()
+        if c_round is not None:
+            state.set_round(c_round)
+            return c_round.number, c_round.nosy.id
+        else:
+            return None, None
+
+    @database_sync_to_async
+    def restart_round(self):
+        state = get_game_state(self.game_id)
+        state.set_round(state.game.restart_round())
+
+        return state.round_number, state.nosy
+
+    @database_sync_to_async
+    def answer_ended(self):
+        c_round = get_game_state(self.game_id).round
+        c_round.answer_ended = datetime.datetime.now()
+        c_round.save()
+
+    @database_sync_to_async
+    def qualify_ended(self):
+        return self.end_qualify(get_game_state(self.game_id).round)
+
+    def end_qualify(self, c_round):
+        c_round.qualify_ended = datetime.datetime.now()
+        c_round.save()
+
+        c_round.create_qualifications()
+
+        correct_answer = c_round.correct_answer
+        return [{'userid': q.player_id,
+                 'correct_answer': correct_answer,
+                 'graded_answer': q.move.answer,
+                 'grade': q.move.evaluation
+                 } for q in c_round.qualifications.select_related('move')]
+
+    @database_sync_to_async
+    def asses_ended(self):
+        c_round = get_game_state(self.game_id).round
+        c_round.end()
+
+    @database_sync_to_async
+    def get_players_without_move(self):
+        round = get_game_state(self.game_id).round
+        return round.missing_players
+
+    @database_sync_to_async
+    def get_missing_evaluations(self):
+        round = get_game_state(self.game_id).round
+        return round.missing_evaluations
+
+    @database_sync_to_async
+    def get_missing_qualifications(self):
+        c_round = get_game_state(self.game_id).round
+        return c_round.missing_qualifications_players
+
+    @database_sync_to_async
+    def close_evaluations(self):
+        round = get_game_state(self.game_id).round
+        round.close_evaluations()
+
+    @database_sync_to_async
+    def get_round_results(self):
+        state = get_game_state(self.game_id)
+        round_result = state.round.get_results()
+        game_scores = state.game.get_scores()
+
+        return round_result, game_scores
+
+    @database_sync_to_async
+    def create_nosy_fault(self, category):
+        state = get_game_state(self.game_id)
+        c_round = state.round
+        fault = c_round.create_fault(c_round.nosy_id, category)
+        is_disqualified = state.game.is_disqualified(c_round.nosy_id)
+        return fault.player_id, fault.category, is_disqualified
+
+    @database_sync_to_async
+    def create_faults(self, player_ids, category):
+        state = get_game_state(self.game_id)
+        state.round.create_faults(player_ids, category)
+        return player_ids, state.game.disqualified_among(player_ids)
+
+    @database_sync_to_async
+    def get_moves_count(self):
+        return get_game_state(self.game_id).round.moves_count
@@ -0,0 +1,33 @@
+from django.db import connection, transaction
+
+
+def indexed_queries():
+    # The hot query shapes and the index each one is expected to use.
+    from trivia_api.models import Fault, Game, Move, Qualification, Round
+
+    return [
+        ('move_round_player_idx', Move.objects.filter(round=1, player=1)),
+        ('move_round_unevaluated_idx', Move.objects.filter(round=1, evaluation__isnull=True)),
+        ('fault_player_round_idx', Fault.objects.filter(round__game=1, player=1)),
+        ('qualification_player_move_idx', Qualification.objects.filter(move__round=1, player=1)),
+        ('round_game_started_idx', Round.objects.filter(game=1).order_by('-started')[:1]),
+        ('game_open_idx', Game.open.order_by('-created')),
+    ]
+
+
+def explain(queryset):
+    # Small or empty tables are cheaper to scan, so sequential scans are disabled
+    # to see which index the planner would choose for the query shape.
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+def check_indexes():
+    results = []
+    for index_name, queryset in indexed_queries():
+        plan = explain(queryset)
+        results.append((index_name, index_name in plan, plan))
+    return results
@@ -0,0 +1,93 @@
+from collections import OrderedDict, deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Q, Subquery
+
+# games with an in-memory journal, the least recently used one is dropped beyond this
+MAX_GAMES = 1000
+
+_journals = OrderedDict()
+
+
+class Journal:
+    # last events of a game in this process, numbered 1, 2, 3... in the order they were sent
+    def __init__(self, size):
+        self.events = deque(maxlen=size)
+        self.seq = 0
+
+    def append(self, user_id, message):
+        self.seq += 1
+        self.events.append((self.seq, user_id, message))
+        return self.seq
+
+    def since(self, last_seq, user_id):
+        # None when some event after last_seq is no longer kept (or was never sent by this process)
+        if last_seq > self.seq or (self.events and self.events[0][0] > last_seq + 1):
+            return None
+        return [(seq, message) for seq, uid, message in self.events
+                if seq > last_seq and (uid is None or uid == user_id)]
+
+
+def get_journal(game_id):
+    journal = _journals.pop(game_id, None)
+    if journal is None:
+        journal = Journal(settings.TRIVIA_JOURNAL_SIZE)
+    _journals[game_id] = journal
+
+    if len(_journals) > MAX_GAMES:
+        _journals.popitem(last=False)
+
+    return journal
+
+
+async def record(game_id, entries):
+    # entries are (user_id, message) pairs, user_id None for the whole game; returns their seqs
+    if settings.TRIVIA_JOURNAL_DB:
+        return await store_events(game_id, entries)
+
+    journal = get_journal(game_id)
+    return [journal.append(user_id, message) for user_id, message in entries]
+
+
+async def events_since(game_id, last_seq, user_id):
+    # (seq, message) of the events after last_seq the user would have received,
+    # None if they cannot all be found
+    if settings.TRIVIA_JOURNAL_DB:
+        return await load_events(game_id, last_seq, user_id)
+
+    journal = _journals.get(game_id)
+    if journal is None:
+        return [] if last_seq == 0 else None
+    return journal.since(last_seq, user_id)
+
+
+@database_sync_to_async
+def store_events(game_id, entries):
+    from trivia_api.models import GameEvent
+
+    events = GameEvent.objects.bulk_create([
+        GameEvent(game_id=game_id, user_id=user_id, message=message) for user_id, message in entries
+    ])
+
+    # the same bound as the in-memory journal
+    size = settings.TRIVIA_JOURNAL_SIZE
+    oldest_kept = GameEvent.objects.filter(game_id=game_id).order_by('-id').values('id')[size - 1:size]
+    GameEvent.objects.filter(game_id=game_id, id__lt=Subquery(oldest_kept)).delete()
+
+    return [e.id for e in events]
+
+
+@database_sync_to_async
+def load_events(game_id, last_seq, user_id):
+    from trivia_api.models import GameEvent
+
+    events = GameEvent.objects.filter(game=game_id)
+
+    # ids are not consecutive within a game, a full journal tells that older events were dropped
+    oldest = events.order_by('id').values_list('id', flat=True).first()
+    if oldest is not None and 0 < last_seq < oldest and events.count() >= settings.TRIVIA_JOURNAL_SIZE:
+        return None
+
+    return list(events.filter(Q(user__isnull=True) | Q(user=user_id), id__gt=last_seq)
+                .order_by('id').values_list('id', 'message'))
@@ -0,0 +1,386 @@
+import asyncio
+import json
+import threading
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+import psycopg2
+from channels.layers import BaseChannelLayer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+
+async def group_send_many(channel_layer, group_messages):
+    # (group, message) pairs, in one call on layers that support it
+    if hasattr(channel_layer, 'group_send_many'):
+        await channel_layer.group_send_many(group_messages)
+    else:
+        await asyncio.gather(*(channel_layer.group_send(g, m) for g, m in group_messages))
+
+
+class PostgresChannelLayer(BaseChannelLayer):
+    """
+    Channel layer on top of the Postgres database, so several daphne processes can
+    share groups without running another service.
+
+    Every process LISTENs on its own notification channel. Channel names carry the id
+    of the process that owns them, so a send is one NOTIFY to that process and a
+    group_send is one NOTIFY per process with members in the group (membership is
+    kept in the ChannelGroup table, and each process also keeps its own members).
+    A group message is notified once with the group name and every process delivers
+    it to its own members; group_add and group_discard for a channel of another
+    process are notified to that process so it knows its members. Payloads over the NOTIFY limit are stored in
+    ChannelMessage and only their id is notified; notifications are delivered one
+    after the other, so a stored payload is never overtaken by a later message.
+    Messages for channels of the same process never touch the database.
+    group_send_many sends different messages to several groups with one query.
+    """
+
+    extensions = ['groups', 'flush']
+
+    # NOTIFY payloads must be shorter than 8000 bytes
+    MAX_PAYLOAD = 7900
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 database='default', pool_size=4, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.group_expiry = group_expiry
+        self.database = database
+
+        self.process_id = uuid.uuid4().hex
+        self.channels = {}
+        # group -> {channel: expires} for the channels of this process
+        self.groups = defaultdict(dict)
+
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='pg-channel-layer')
+        self.local = threading.local()
+        self.connections = []
+
+        self.listen_conn = None
+        self.listen_loop = None
+        self.listen_lock = None
+        self.notifications = None
+        self.notifications_task = None
+
+    # Database access
+
+    @property
+    def groups_table(self):
+        from trivia_api.models import ChannelGroup
+        return ChannelGroup._meta.db_table
+
+    @property
+    def messages_table(self):
+        from trivia_api.models import ChannelMessage
+        return ChannelMessage._meta.db_table
+
+    def connect(self):
+        conn = psycopg2.connect(**connections[self.database].get_connection_params())
+        conn.autocommit = True
+        return conn
+
+    def execute(self, sql, params=None, fetch=False):
+        for retry in (True, False):
+            conn = getattr(self.local, 'conn', None)
+            if conn is None or conn.closed:
+                conn = self.local.conn = self.connect()
+                self.connections = [c for c in self.connections if not c.closed] + [conn]
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    return cursor.fetchall() if fetch else None
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                conn.close()
+                if not retry:
+                    raise
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def pg_channel(self, process_id):
+        return f'channels_{process_id}'
+
+    def channel_process(self, channel):
+        if '!' not in channel:
+            raise TypeError(f'{self.__class__.__name__} only supports process-specific channels, not {channel}')
+        return self.non_local_name(channel)[:-1].rsplit('.', 1)[-1]
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific'):
+        # listen before handing out a name, so nothing sent to it can be missed
+        await self.ensure_listener()
+        return f'{prefix}.{self.process_id}!{uuid.uuid4().hex}'
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+
+        await self.dispatch([self.channel_process(channel)], channel, message)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        await self.ensure_listener()
+        self.clean_expired()
+
+        queue = self.channels.setdefault(channel, asyncio.Queue())
+        try:
+            _, message = await queue.get()
+        finally:
+            if queue.empty() and self.channels.get(channel) is queue:
+                del self.channels[channel]
+
+        return message
+
+    async def dispatch(self, process_ids, name, message):
+        await self.dispatch_many({process_id: [(name, message)] for process_id in process_ids})
+
+    async def dispatch_many(self, targets):
+        # targets maps a process id to the (channel or group name, message) pairs it
+        # has to deliver
+        local = targets.pop(self.process_id, [])
+        if targets:
+            await self.run(self.notify, targets)
+
+        sent = time.time()
+        for name, message in local:
+            self.deliver(name, message, sent, copy=True)
+
+    def notify(self, targets):
+        sent = time.time()
+        notifications = []
+        for process_id, deliveries in targets.items():
+            payload = json.dumps({'t': sent, 'd': deliveries}, cls=DjangoJSONEncoder)
+            if len(payload.encode()) > self.MAX_PAYLOAD:
+                rows = self.execute(
+                    f'INSERT INTO {self.messages_table} (payload, created) VALUES (%s, now()) RETURNING id',
+                    [payload], fetch=True
+                )
+                payload = json.dumps({'id': rows[0][0]})
+            notifications += [self.pg_channel(process_id), payload]
+
+        values = ', '.join(['(%s, %s)'] * len(targets))
+        self.execute(f'SELECT pg_notify(c, p) FROM (VALUES {values}) AS n (c, p)', notifications, fetch=True)
+
+    def notify_membership(self, process_id, group, channel, added):
+        payload = json.dumps({'g': [group, channel, added]})
+        self.execute('SELECT pg_notify(%s, %s)', [self.pg_channel(process_id), payload], fetch=True)
+
+    def set_member(self, group, channel, added):
+        if added:
+            self.groups[group][channel] = time.time() + self.group_expiry
+        else:
+            members = self.groups.get(group)
+            if members is not None:
+                members.pop(channel, None)
+                if not members:
+                    del self.groups[group]
+
+    def local_channels(self, name):
+        # a channel name, or a group name resolved to its members in this process
+        if '!' in name:
+            return [name]
+        now = time.time()
+        return [channel for channel, expires in self.groups.get(name, {}).items() if expires > now]
+
+    def deliver(self, name, message, sent, copy=False):
+        expires = sent + self.expiry
+        if expires < time.time():
+            return
+
+        # senders may live in another process, so a full channel drops the message
+        # instead of raising ChannelFull
+        channels = self.local_channels(name)
+        for channel in channels:
+            queue = self.channels.setdefault(channel, asyncio.Queue())
+            if queue.qsize() < self.get_capacity(channel):
+                queue.put_nowait((expires, deepcopy(message) if copy or len(channels) > 1 else message))
+
+    def clean_expired(self):
+        now = time.time()
+        for channel, queue in list(self.channels.items()):
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+            if queue.empty() and not queue._getters:
+                del self.channels[channel]
+
+        for group, members in list(self.groups.items()):
+            for channel, expires in list(members.items()):
+                if expires < now:
+                    del members[channel]
+            if not members:
+                del self.groups[group]
+
+    # Listener
+
+    async def ensure_listener(self):
+        loop = asyncio.get_running_loop()
+        if self.listen_loop is loop:
+            return
+
+        if self.listen_lock is None or self.listen_lock._loop is not loop:
+            self.listen_lock = asyncio.Lock()
+
+        async with self.listen_lock:
+            if self.listen_loop is loop:
+                return
+
+            self.stop_listener()
+            conn = await self.run(self.connect)
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.pg_channel(self.process_id)}')
+            await self.run(self.clean_tables)
+
+            self.notifications = asyncio.Queue()
+            self.notifications_task = loop.create_task(self.deliver_notifications(self.notifications))
+            loop.add_reader(conn.fileno(), self.on_notify)
+            self.listen_conn = conn
+            self.listen_loop = loop
+
+    def stop_listener(self):
+        if self.listen_conn is not None:
+            try:
+                self.listen_loop.remove_reader(self.listen_conn.fileno())
+            except Exception:
+                pass
+            self.listen_conn.close()
+        if self.notifications_task is not None:
+            self.notifications_task.cancel()
+        self.listen_conn = None
+        self.listen_loop = None
+        self.notifications = None
+        self.notifications_task = None
+
+    def on_notify(self):
+        try:
+            self.listen_conn.poll()
+        except psycopg2.Error:
+            # connection lost: listen again on a new one
+            self.stop_listener()
+            asyncio.ensure_future(self.ensure_listener())
+            return
+
+        while self.listen_conn.notifies:
+            self.notifications.put_nowait(json.loads(self.listen_conn.notifies.pop(0).payload))
+
+    async def deliver_notifications(self, notifications):
+        # in the order they were notified: a stored payload is fetched before any
+        # later notification is delivered
+        while True:
+            data = await notifications.get()
+            try:
+                if 'g' in data:
+                    self.set_member(*data['g'])
+                    continue
+                if 'id' in data:
+                    data = await self.receive_stored(data['id'])
+                if data is not None:
+                    self.deliver_payload(data)
+            except Exception:
+                traceback.print_exc()
+
+    async def receive_stored(self, message_id):
+        rows = await self.run(
+            self.execute, f'DELETE FROM {self.messages_table} WHERE id = %s RETURNING payload', [message_id], True
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def deliver_payload(self, data):
+        for name, message in data['d']:
+            self.deliver(name, message, data['t'])
+
+    def clean_tables(self):
+        self.execute(f'DELETE FROM {self.groups_table} WHERE expires < now()')
+        self.execute(
+            f"DELETE FROM {self.messages_table} WHERE created < now() - %s * interval '1 second'", [self.expiry]
+        )
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+
+        await self.run(
+            self.execute,
+            f"INSERT INTO {self.groups_table} (group_name, channel_name, expires) "
+            f"VALUES (%s, %s, now() + %s * interval '1 second') "
+            f"ON CONFLICT (group_name, channel_name) DO UPDATE SET expires = EXCLUDED.expires",
+            [group, channel, self.group_expiry]
+        )
+        await self.update_owner(group, channel, True)
+
+    async def update_owner(self, group, channel, added):
+        # the process that owns the channel delivers the group messages to it
+        process_id = self.channel_process(channel)
+        if process_id == self.process_id:
+            self.set_member(group, channel, added)
+        else:
+            await self.run(self.notify_membership, process_id, group, channel, added)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), 'Invalid channel name'
+        assert self.valid_group_name(group), 'Invalid group name'
+
+        await self.run(
+            self.execute,
+            f'DELETE FROM {self.groups_table} WHERE group_name = %s AND channel_name = %s',
+            [group, channel]
+        )
+        await self.update_owner(group, channel, False)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Invalid group name'
+
+        rows = await self.run(
+            self.execute,
+            f'SELECT channel_name FROM {self.groups_table} WHERE group_name = %s AND expires > now()',
+            [group], True
+        )
+
+        await self.dispatch({self.channel_process(channel) for (channel,) in rows}, group, message)
+
+    async def group_send_many(self, group_messages):
+        # Sends a different message to each group with one membership query and at
+        # most one NOTIFY per process.
+        group_messages = list(group_messages)
+        for group, message in group_messages:
+            assert isinstance(message, dict), 'Message is not a dict'
+            assert self.valid_group_name(group), 'Invalid group name'
+
+        rows = await self.run(
+            self.execute,
+            f'SELECT group_name, channel_name FROM {self.groups_table} WHERE group_name = ANY(%s) AND expires > now()',
+            [[group for group, _ in group_messages]], True
+        )
+
+        processes = defaultdict(set)
+        for group, channel in rows:
+            processes[group].add(self.channel_process(channel))
+
+        targets = defaultdict(list)
+        for group, message in group_messages:
+            for process_id in processes[group]:
+                targets[process_id].append((group, message))
+
+        await self.dispatch_many(targets)
+
+    # Flush extension
+
+    async def flush(self):
+        self.channels = {}
+        self.groups.clear()
+        await self.run(self.execute, f'DELETE FROM {self.groups_table}')
+        await self.run(self.execute, f'DELETE FROM {self.messages_table}')
+
+    async def close(self):
+        self.stop_listener()
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
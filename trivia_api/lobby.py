@@ -0,0 +1,31 @@
+from channels.layers import get_channel_layer
+
+from trivia_api.metrics import channel_sends
+from trivia_api.models import Game, Membership
+from trivia_api.serializers import GameLightSerializer
+
+LOBBY_GROUP = 'lobby'
+SNAPSHOT_SIZE = 100
+
+
+def lobby_games():
+    # newest open games, as GameViewSet.list returns them with ?view=light
+    games = Game.open.select_related('creator').with_player_count().order_by('-created')[:SNAPSHOT_SIZE]
+    return GameLightSerializer(games, many=True).data
+
+
+def lobby_game(game, player_count):
+    return {**GameLightSerializer(game).data, 'player_count': player_count}
+
+
+async def send_lobby(message, channel_layer=None):
+    channel_layer = channel_layer if channel_layer is not None else get_channel_layer()
+    channel_sends.inc('lobby')
+    await channel_layer.group_send(LOBBY_GROUP, {'type': "lobby_message", 'message': message})
+
+
+async def send_player_count(game_id):
+    # the count after the write, so a client that missed a delta catches up with the next one
+    await send_lobby({'type': 'player_count',
+                      'game': game_id,
+                      'player_count': await Membership.objects.filter(game_id=game_id).acount()})
@@ -0,0 +1,115 @@
+import asyncio
+import statistics
+import time
+import uuid
+from collections import defaultdict
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.urls import path
+
+from trivia_api.consumers import TriviaConsumer
+from trivia_api.engine import GameEngine
+from trivia_api.metrics import percentile
+from trivia_api.models import Game
+
+latencies = defaultdict(list)
+
+
+class TimedConsumer(TriviaConsumer):
+    async def receive_json(self, content=None):
+        start = time.perf_counter()
+        await super().receive_json(content)
+        latencies[content['action']].append((time.perf_counter() - start) * 1000)
+
+
+class WithUser:
+    def __init__(self, inner, user):
+        self.inner = inner
+        self.user = user
+
+    async def __call__(self, scope, receive, send):
+        return await self.inner(dict(scope, user=self.user), receive, send)
+
+
+class Command(BaseCommand):
+    help = 'Plays full games through the websocket consumer and reports how long each action takes to handle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=5)
+        parser.add_argument('--games', type=int, default=4, help='games played concurrently')
+
+    def handle(self, *args, **options):
+        GameEngine.DELTA_TIME = 0
+        GameEngine.START_TIME = 0
+        GameEngine.QUALIFY_TIME = 1
+        GameEngine.ASSESS_TIME = 1
+
+        latencies.clear()
+        games = [self.create_game(options['players']) for _ in range(options['games'])]
+        try:
+            start = time.perf_counter()
+            asyncio.run(self.play_all(games))
+            elapsed = time.perf_counter() - start
+        finally:
+            for game, users in games:
+                game.delete()
+                User.objects.filter(id__in=[u.id for u in users]).delete()
+
+        self.stdout.write(f'{options["games"]} games x {options["players"]} players in {elapsed:.1f} s')
+        self.stdout.write(f'  {"action":<10} {"count":>6} {"p50 (ms)":>10} {"p95 (ms)":>10}')
+        for action, values in latencies.items():
+            self.stdout.write(f'  {action:<10} {len(values):>6} {statistics.median(values):>10.2f} '
+                              f'{percentile(values, 95):>10.2f}')
+
+    def create_game(self, players):
+        prefix = f'bench_{uuid.uuid4().hex[:8]}'
+        users = [User.objects.create_user(f'{prefix}_{i}') for i in range(players)]
+        game = Game.objects.create(name=prefix, creator=users[0], question_time=1, answer_time=1)
+        game.players.add(*users)
+        return game, users
+
+    async def play_all(self, games):
+        await asyncio.gather(*(self.play(game, users) for game, users in games))
+
+    async def play(self, game, users):
+        router = URLRouter([path('ws/trivia/<int:game_id>/', TimedConsumer.as_asgi())])
+        sockets = {}
+        for user in users:
+            socket = WebsocketCommunicator(WithUser(router, user), f'/ws/trivia/{game.id}/')
+            connected, _ = await socket.connect()
+            assert connected
+            sockets[user.id] = socket
+
+        await sockets[users[0].id].send_json_to({'action': 'start', 'rounds': str(len(users))})
+        for _ in range(len(users)):
+            started = [await self.receive(s, 'round_started') for s in sockets.values()]
+            nosy = started[0]['nosy_id']
+
+            await sockets[nosy].send_json_to({'action': 'question', 'text': 'pregunta'})
+            for socket in sockets.values():
+                await self.receive(socket, 'round_question')
+
+            for user_id, socket in sockets.items():
+                await socket.send_json_to({'action': 'answer', 'text': f'respuesta {user_id}'})
+            for _ in range(len(users) - 1):
+                answer = await self.receive(sockets[nosy], 'round_answer')
+                await sockets[nosy].send_json_to({'action': 'qualify', 'userid': str(answer['userid']), 'grade': '3'})
+
+            for user_id, socket in sockets.items():
+                if user_id != nosy:
+                    await self.receive(socket, 'round_review_answer')
+                    await socket.send_json_to({'action': 'assess', 'correctness': 'true'})
+            for socket in sockets.values():
+                await self.receive(socket, 'round_result')
+
+        for socket in sockets.values():
+            await socket.disconnect()
+
+    async def receive(self, socket, message_type):
+        while True:
+            message = await socket.receive_json_from(timeout=30)
+            if message['type'] == message_type:
+                return message
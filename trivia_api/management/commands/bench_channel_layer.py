@@ -0,0 +1,84 @@
+import asyncio
+import statistics
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from trivia_api.layers import PostgresChannelLayer
+from trivia_api.metrics import percentile
+
+
+class Command(BaseCommand):
+    help = 'Measures latency and throughput of the Postgres channel layer against the in-memory one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--group-size', type=int, default=50)
+        parser.add_argument('--layers', nargs='+', default=['inmemory', 'postgres'],
+                            choices=['inmemory', 'postgres'])
+
+    def handle(self, *args, **options):
+        for name in options['layers']:
+            results = asyncio.run(self.bench(name, options['messages'], options['group_size']))
+            self.stdout.write(f'{name}:')
+            for label, value in results:
+                self.stdout.write(f'  {label:<32} {value}')
+
+    def make_layers(self, name):
+        if name == 'inmemory':
+            layer = InMemoryChannelLayer(capacity=10 ** 6)
+            return layer, layer
+        # two instances behave like two daphne processes, so every message goes
+        # through NOTIFY instead of the same-process shortcut
+        return PostgresChannelLayer(capacity=10 ** 6), PostgresChannelLayer(capacity=10 ** 6)
+
+    async def bench(self, name, messages, group_size):
+        sender, receiver = self.make_layers(name)
+        channel = await receiver.new_channel()
+        group = 'bench_group'
+        members = [await receiver.new_channel() for _ in range(group_size)]
+
+        try:
+            # warm up connections and the listener
+            await sender.send(channel, {'type': 'bench'})
+            await receiver.receive(channel)
+
+            latencies = []
+            for _ in range(messages):
+                start = time.perf_counter()
+                await sender.send(channel, {'type': 'bench'})
+                await receiver.receive(channel)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            receiving = asyncio.ensure_future(self.receive_many(receiver, channel, messages))
+            for i in range(messages):
+                await sender.send(channel, {'type': 'bench', 'i': i})
+            await receiving
+            throughput = messages / (time.perf_counter() - start)
+
+            for member in members:
+                await sender.group_add(group, member)
+            rounds = max(messages // group_size, 1)
+            start = time.perf_counter()
+            receiving = [asyncio.ensure_future(self.receive_many(receiver, m, rounds)) for m in members]
+            for _ in range(rounds):
+                await sender.group_send(group, {'type': 'bench'})
+            await asyncio.gather(*receiving)
+            fan_out = rounds * group_size / (time.perf_counter() - start)
+        finally:
+            await sender.flush()
+            await sender.close()
+            await receiver.close()
+
+        return [
+            ('send/receive latency p50 (ms)', f'{statistics.median(latencies):.3f}'),
+            ('send/receive latency p95 (ms)', f'{percentile(latencies, 95):.3f}'),
+            ('send throughput (msg/s)', f'{throughput:.0f}'),
+            (f'group_send x{group_size} (deliveries/s)', f'{fan_out:.0f}'),
+        ]
+
+    async def receive_many(self, layer, channel, count):
+        for _ in range(count):
+            await layer.receive(channel)
@@ -0,0 +1,50 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from trivia_api.models import Game, Membership, Move, Qualification, Round
+
+
+class Command(BaseCommand):
+    help = 'Times Round.create_qualifications for games of several sizes (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100, 250, 500])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'  {"players":>8} {"ms":>10} {"queries":>8} {"qualifications":>15} {"self reviews":>13}')
+        for size in options['sizes']:
+            with transaction.atomic():
+                c_round = self.create_round(size)
+
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    c_round.create_qualifications()
+                    elapsed = (time.perf_counter() - start) * 1000
+
+                qualifications = Qualification.objects.filter(move__round=c_round)
+                self_reviews = qualifications.filter(move__player=F('player')).count()
+                self.stdout.write(f'  {size:>8} {elapsed:>10.1f} {len(queries):>8} {qualifications.count():>15} '
+                                  f'{self_reviews:>13}')
+
+                transaction.set_rollback(True)
+
+    def create_round(self, size):
+        prefix = f'bench_{uuid.uuid4().hex[:8]}'
+        users = User.objects.bulk_create([User(username=f'{prefix}_{i}') for i in range(size)])
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+        game = Game.objects.create(name=prefix, creator=users[0], rounds_number=size)
+        Membership.objects.bulk_create([Membership(game=game, player=u) for u in users])
+
+        # everybody answers except the nosy and one player who ran out of time
+        c_round = Round.objects.create(game=game, number=1, nosy=users[0])
+        Move.objects.bulk_create([Move(round=c_round, player=u, answer='respuesta') for u in users[2:]])
+
+        return c_round
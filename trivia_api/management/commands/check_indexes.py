@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from trivia_api.indexes import check_indexes
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the hot queries and fails if one of them does not use its index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true', help='print the plan of every query')
+
+    def handle(self, *args, **options):
+        missing = []
+        for index_name, used, plan in check_indexes():
+            self.stdout.write(f'{"ok" if used else "MISSING":<8} {index_name}')
+            if options['plans'] or not used:
+                self.stdout.write('  ' + plan.replace('\n', '\n  '))
+            if not used:
+                missing.append(index_name)
+
+        if missing:
+            raise CommandError(f'Queries not using their index: {", ".join(missing)}')
@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from trivia_api.tournaments import MAX_GAMES, announce_tournament, create_tournament, find_players
+
+
+class Command(BaseCommand):
+    help = 'Creates several games from one template and deals the listed players among them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('creator', help='username of the creator of every game')
+        parser.add_argument('name')
+        parser.add_argument('--games', type=int, required=True)
+        parser.add_argument('--rounds', type=int, default=None)
+        parser.add_argument('--question-time', type=int, default=90, choices=[60, 90, 120])
+        parser.add_argument('--answer-time', type=int, default=90, choices=[60, 90, 120])
+        parser.add_argument('--players', nargs='*', default=[], help='usernames of the players')
+        parser.add_argument('--players-file', help='file with one username per line')
+
+    def handle(self, *args, **options):
+        if not 0 < options['games'] <= MAX_GAMES:
+            raise CommandError(f'--games must be between 1 and {MAX_GAMES}')
+
+        creator = User.objects.filter(username=options['creator']).first()
+        if creator is None:
+            raise CommandError(f'Unknown creator {options["creator"]}')
+
+        usernames = list(options['players'])
+        if options['players_file']:
+            with open(options['players_file']) as f:
+                usernames += [line.strip() for line in f if line.strip()]
+
+        players, unknown = find_players(usernames)
+        if unknown:
+            raise CommandError(f'Unknown players: {", ".join(unknown)}')
+
+        template = {
+            'name': options['name'],
+            'rounds_number': options['rounds'],
+            'question_time': options['question_time'],
+            'answer_time': options['answer_time'],
+        }
+        games, enrollments = create_tournament(creator, template, options['games'], players)
+        announce_tournament(games)
+
+        for game in games:
+            self.stdout.write(f'{game.id:>8} {game.name:<30} {len(enrollments[game.id]):>4} players')
@@ -0,0 +1,64 @@
+import asyncio
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from trivia_api.metrics import percentile
+from trivia_api.models import Game, Membership
+
+
+class Command(BaseCommand):
+    help = 'Joins many players at once into one lobby through the join_game endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50, help='joins in flight at the same time')
+
+    def handle(self, *args, **options):
+        prefix = f'load_{uuid.uuid4().hex[:8]}'
+        users = User.objects.bulk_create([User(username=f'{prefix}_{i}') for i in range(options['players'] + 1)])
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+        game = Game.objects.create(name=prefix, creator=users[0])
+        Membership.objects.create(game=game, player=users[0])
+        try:
+            tokens = [str(AccessToken.for_user(u)) for u in users[1:]]
+
+            start = time.perf_counter()
+            latencies, statuses = asyncio.run(self.join_all(game, tokens, options['concurrency']))
+            elapsed = time.perf_counter() - start
+
+            joined = Membership.objects.filter(game=game).count() - 1
+        finally:
+            game.delete()
+            User.objects.filter(username__startswith=prefix).delete()
+
+        self.stdout.write(f'{len(tokens)} joins in {elapsed:.2f} s ({len(tokens) / elapsed:.0f} joins/s)')
+        self.stdout.write(f'  p50 {statistics.median(latencies):.2f} ms, '
+                          f'p95 {percentile(latencies, 95):.2f} ms')
+
+        failed = [s for s in statuses if s != 200]
+        if failed or joined != len(tokens):
+            raise CommandError(f'{len(failed)} joins failed, {joined} of {len(tokens)} players in the game')
+
+    async def join_all(self, game, tokens, concurrency):
+        url = reverse('game-join-game', args=[game.id])
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def join(token):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await AsyncClient().post(url, AUTHORIZATION=f'Bearer {token}')
+                latencies.append((time.perf_counter() - start) * 1000)
+                return response.status_code
+
+        statuses = await asyncio.gather(*(join(t) for t in tokens))
+        return latencies, statuses
@@ -0,0 +1,13 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from trivia_api.orchestrator import Orchestrator
+
+
+class Command(BaseCommand):
+    help = 'Runs the phase timers of every active game (set TRIVIA_EXTERNAL_ORCHESTRATOR in the web workers)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Orchestrator running')
+        asyncio.run(Orchestrator().run())
@@ -0,0 +1,159 @@
+import bisect
+import math
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Per-process metrics in the Prometheus text format, served by metrics_view. Recording
+# is a few additions under a lock; the text is only built when /metrics is scraped.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_registry = []
+
+# [queries, seconds] of the operation being measured, see measure and query_wrapper
+_queries = ContextVar('trivia_queries', default=None)
+
+
+def _labels(names, values):
+    return ','.join(f'{n}="{v}"' for n, v in zip(names, values))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}
+        _registry.append(self)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with _lock:
+            series = dict(self.series)
+        for values, value in sorted(series.items()):
+            lines += self.expose_series(_labels(self.labels, values), value)
+        return lines
+
+    def expose_series(self, labels, value):
+        return [f'{self.name}{{{labels}}} {value}' if labels else f'{self.name} {value}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *values, amount=1):
+        with _lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *values):
+        self.inc(*values, amount=-1)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def observe(self, value, *values):
+        with _lock:
+            series = self.series.get(values)
+            if series is None:
+                # a count per bucket and +Inf, then the sum
+                series = self.series[values] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[bisect.bisect_left(BUCKETS, value)] += 1
+            series[-1] += value
+
+    def expose_series(self, labels, series):
+        prefix = f'{labels},' if labels else ''
+        lines, count = [], 0
+        for bound, n in zip(BUCKETS + ('+Inf',), series):
+            count += n
+            lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        return lines + [f'{self.name}_sum{suffix} {series[-1]}', f'{self.name}_count{suffix} {count}']
+
+
+action_seconds = Histogram('trivia_action_seconds', 'Time to handle a websocket action', ('action',))
+timer_seconds = Histogram('trivia_timer_seconds', 'Time to handle a phase timer', ('timer',))
+view_seconds = Histogram('trivia_view_seconds', 'Time to handle a game API request', ('view',))
+db_queries = Counter('trivia_db_queries_total', 'Queries made by measured operations', ('kind', 'name'))
+db_seconds = Counter('trivia_db_query_seconds_total', 'Time spent in the queries of measured operations',
+                     ('kind', 'name'))
+channel_sends = Counter('trivia_channel_sends_total', 'Messages sent to channel layer groups', ('target',))
+open_sockets = Gauge('trivia_open_sockets', 'Websockets open in this process', ('consumer',))
+
+
+class measure:
+    # with measure(histogram, name): the time of the block and the queries it makes,
+    # including those run in threads by database_sync_to_async (they copy the context)
+    def __init__(self, histogram, name=None):
+        self.histogram = histogram
+        self.name = name
+
+    def __enter__(self):
+        self.queries = [0, 0.0]
+        self.token = _queries.set(self.queries)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        _queries.reset(self.token)
+
+        name = self.name if self.name is not None else 'unknown'
+        kind = self.histogram.labels[0]
+        self.histogram.observe(elapsed, name)
+        db_queries.inc(kind, name, amount=self.queries[0])
+        db_seconds.inc(kind, name, amount=self.queries[1])
+
+
+def percentile(values, p):
+    # nearest-rank percentile of the samples, as the benchmark commands report it
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * p / 100) - 1, 0)]
+
+
+def query_wrapper(execute, sql, params, many, context):
+    queries = _queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries[0] += 1
+        queries[1] += time.perf_counter() - start
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    # connected to connection_created by TriviaConfig.ready
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.TRIVIA_METRICS_IPS:
+        raise Http404
+
+    from trivia_api.models import Game
+
+    lines = []
+    for metric in _registry:
+        lines += metric.expose()
+
+    # only counted when scraped
+    active = Game.objects.filter(started__isnull=False, ended__isnull=True).count()
+    lines += ['# HELP trivia_active_games Games started and not ended', '# TYPE trivia_active_games gauge',
+              f'trivia_active_games {active}']
+
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,19 +1,82 @@
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from jwt import decode as jwt_decode
 from django.conf import settings
 
+import hashlib
+import time
+from collections import OrderedDict
 from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 
 
+TOKEN_CACHE_SIZE = getattr(settings, 'JWT_TOKEN_CACHE_SIZE', 10000)
+USER_CACHE_SIZE = getattr(settings, 'JWT_USER_CACHE_SIZE', 10000)
+USER_CACHE_TTL = getattr(settings, 'JWT_USER_CACHE_TTL', 30)
+
+
+class ExpiringLRU:
+	def __init__(self, size):
+		self.size = size
+		self.items = OrderedDict()
+
+	def get(self, key):
+		item = self.items.get(key)
+		if item is None:
+			return None
+
+		value, expires = item
+		if expires is not None and expires <= time.time():
+			del self.items[key]
+			return None
+
+		self.items.move_to_end(key)
+		return value
+
+	def set(self, key, value, expires):
+		self.items[key] = (value, expires)
+		self.items.move_to_end(key)
+		while len(self.items) > self.size:
+			self.items.popitem(last=False)
+
+
+# verified claims keyed by the token hash, until the token expires
+token_cache = ExpiringLRU(TOKEN_CACHE_SIZE)
+# user rows for a few seconds, so reconnects do not query the database each time
+user_cache = ExpiringLRU(USER_CACHE_SIZE)
+
+
+def get_token(scope):
+	values = parse_qs(scope["query_string"].decode("utf8")).get("token")
+	if not values:
+		return None
+
+	token = values[0]
+	# a JWT is header.payload.signature
+	if len(token) > 4096 or token.count(".") != 2:
+		return None
+	return token
+
+
+def get_claims(token):
+	from rest_framework_simplejwt.tokens import UntypedToken
+
+	key = hashlib.sha256(token.encode()).digest()
+	claims = token_cache.get(key)
+	if claims is None:
+		try:
+			claims = UntypedToken(token).payload
+		except (InvalidToken, TokenError) as e:
+			return None
+		token_cache.set(key, claims, claims.get("exp"))
+	return claims
+
+
 @database_sync_to_async
-def get_user(validated_token):
+def get_user(user_id):
 	from django.contrib.auth import get_user_model
 
 	try:
-		user = get_user_model().objects.get(id=validated_token["user_id"])
-		# return get_user_model().objects.get(id=toke_id)
+		user = get_user_model().objects.get(id=user_id)
 		return user
 	except:
 		from django.contrib.auth.models import AnonymousUser
@@ -21,21 +84,28 @@ def get_user(validated_token):
 		return AnonymousUser()
 
 
+async def get_cached_user(user_id):
+	user = user_cache.get(user_id)
+	if user is None:
+		user = await get_user(user_id)
+		if user.is_authenticated:
+			user_cache.set(user_id, user, time.time() + USER_CACHE_TTL)
+	return user
+
+
 class JwtAuthMiddleware(BaseMiddleware):
 	def __init__(self, inner):
 		self.inner = inner
 
 	async def __call__(self, scope, receive, send):
-		from rest_framework_simplejwt.tokens import UntypedToken
-
-		token = parse_qs(scope["query_string"].decode("utf8"))["token"][0]
+		token = get_token(scope)
+		if token is None:
+			return None
 
-		try:
-			UntypedToken(token)
-		except (InvalidToken, TokenError) as e:
+		claims = get_claims(token)
+		if claims is None:
 			return None
-		else:
-			decoded_data = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-			scope["user"] = await get_user(validated_token=decoded_data)
+
+		scope["user"] = await get_cached_user(claims.get("user_id"))
 
 		return await super().__call__(scope, receive, send)
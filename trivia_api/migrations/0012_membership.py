@@ -0,0 +1,68 @@
+# Generated by Django 4.1.5 on 2026-10-18 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('trivia_api', '0011_alter_actionerror_round'),
+    ]
+
+    operations = [
+        # Game.players already has a join table (game_id, user_id); adopt it as the
+        # Membership model instead of creating a new one.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Membership',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='trivia_api.game')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'trivia_api_game_players',
+                        'unique_together': {('game', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='game',
+                    name='players',
+                    field=models.ManyToManyField(blank=True, related_name='games', through='trivia_api.Membership', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AlterModelTable(
+            name='membership',
+            table=None,
+        ),
+        migrations.RenameField(
+            model_name='membership',
+            old_name='user',
+            new_name='player',
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='faults',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='errors',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='disqualified',
+            field=models.BooleanField(default=False),
+        ),
+    ]
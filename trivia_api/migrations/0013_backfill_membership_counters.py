@@ -0,0 +1,50 @@
+from django.db import migrations, models
+
+
+def nosy_score(Qualification, c_round):
+    qualifications = Qualification.objects.filter(move__round=c_round).count()
+    if qualifications == 0:
+        return 3
+
+    positive = qualifications - Qualification.objects.filter(move__round=c_round, is_correct=False).count()
+    if positive / qualifications >= 0.8:
+        return 3
+    elif positive / qualifications >= 0.5:
+        return 1
+    return -2
+
+
+def backfill_counters(apps, schema_editor):
+    Membership = apps.get_model('trivia_api', 'Membership')
+    Move = apps.get_model('trivia_api', 'Move')
+    Round = apps.get_model('trivia_api', 'Round')
+    Qualification = apps.get_model('trivia_api', 'Qualification')
+    Fault = apps.get_model('trivia_api', 'Fault')
+    ActionError = apps.get_model('trivia_api', 'ActionError')
+
+    for m in Membership.objects.all():
+        answering = Move.objects.filter(
+            round__game=m.game_id, player=m.player_id, evaluation__isnull=False
+        ).aggregate(models.Sum('evaluation'))['evaluation__sum'] or 0
+        asking = sum(nosy_score(Qualification, r)
+                     for r in Round.objects.filter(game=m.game_id, nosy=m.player_id, ended__isnull=False))
+        faults = Fault.objects.filter(
+            round__game=m.game_id, player=m.player_id
+        ).aggregate(models.Sum('fault_value'))['fault_value__sum'] or 0
+
+        m.score = answering + asking
+        m.faults = faults
+        m.errors = ActionError.objects.filter(round__game=m.game_id, player=m.player_id).count()
+        m.disqualified = faults >= 3
+        m.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0012_membership'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.5 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0015_channel_layer_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='deadline',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='timer',
+            field=models.CharField(blank=True, choices=[('start', 'START'), ('question', 'QUESTION'), ('answer', 'ANSWER'), ('qualify', 'QUALIFY'), ('assess', 'ASSESS')], default=None, max_length=8, null=True),
+        ),
+    ]
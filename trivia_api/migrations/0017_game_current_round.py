@@ -0,0 +1,19 @@
+# Generated by Django 4.1.5 on 2026-10-18 03:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0016_game_timer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='current_round',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='trivia_api.round'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+def backfill_current_round(apps, schema_editor):
+    Game = apps.get_model('trivia_api', 'Game')
+    Round = apps.get_model('trivia_api', 'Round')
+
+    Game.objects.update(current_round=models.Subquery(
+        Round.objects.filter(game=models.OuterRef('pk')).order_by('-started').values('id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0017_game_current_round'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_current_round, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.1.5 on 2026-10-18 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('trivia_api', '0018_backfill_game_current_round'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fault',
+            name='player',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='faults', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='round',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='trivia_api.round'),
+        ),
+        migrations.AlterField(
+            model_name='qualification',
+            name='player',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='qualifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='round',
+            name='game',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rounds', to='trivia_api.game'),
+        ),
+        migrations.AddIndex(
+            model_name='fault',
+            index=models.Index(fields=['player', 'round'], name='fault_player_round_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('started__isnull', True)), fields=['created'], name='game_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='move',
+            index=models.Index(fields=['round', 'player'], name='move_round_player_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='move',
+            index=models.Index(condition=models.Q(('evaluation__isnull', True)), fields=['round'], name='move_round_unevaluated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qualification',
+            index=models.Index(fields=['player', 'move'], name='qualification_player_move_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='round',
+            index=models.Index(fields=['game', 'started'], name='round_game_started_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0019_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='round',
+            name='number',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
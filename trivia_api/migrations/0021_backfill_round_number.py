@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def backfill_round_number(apps, schema_editor):
+    Round = apps.get_model('trivia_api', 'Round')
+
+    rounds = []
+    number = {}
+    for r in Round.objects.order_by('game', 'started', 'id'):
+        number[r.game_id] = number.get(r.game_id, 0) + 1
+        r.number = number[r.game_id]
+        rounds.append(r)
+
+    Round.objects.bulk_update(rounds, ['number'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0020_round_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_round_number, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.5 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0021_backfill_round_number'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='round',
+            name='number',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='round',
+            constraint=models.UniqueConstraint(fields=('game', 'number'), name='round_game_number_unique'),
+        ),
+    ]
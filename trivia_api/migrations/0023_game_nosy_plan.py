@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0022_alter_round_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='nosy_plan',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,29 @@
+import random
+
+from django.db import migrations
+
+
+def backfill_nosy_plan(apps, schema_editor):
+    Game = apps.get_model('trivia_api', 'Game')
+    Membership = apps.get_model('trivia_api', 'Membership')
+    Round = apps.get_model('trivia_api', 'Round')
+
+    # games in progress keep choosing among the active players that were not nosy yet
+    for game in Game.objects.filter(started__isnull=False, ended__isnull=True):
+        past = set(Round.objects.filter(game=game, nosy__isnull=False).values_list('nosy', flat=True))
+        pending = [p for p in Membership.objects.filter(game=game, disqualified=False)
+                   .values_list('player', flat=True) if p not in past]
+
+        game.nosy_plan = random.sample(pending, len(pending))
+        game.save(update_fields=['nosy_plan'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trivia_api', '0023_game_nosy_plan'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_nosy_plan, migrations.RunPython.noop),
+    ]
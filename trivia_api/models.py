@@ -1,11 +1,24 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 
 import datetime
 import random
 
+from trivia_api.assignment import assign_reviews
 
-class OpenGamesManager(models.Manager):
+
+def count_of(queryset):
+    # COUNT as a scalar subquery, so it can be annotated next to joins without a GROUP BY
+    return models.Subquery(queryset.order_by().annotate(count=models.Func('pk', function='COUNT')).values('count'),
+                           output_field=models.IntegerField())
+
+
+class GameQuerySet(models.QuerySet):
+    def with_player_count(self):
+        return self.annotate(player_count=count_of(Membership.objects.filter(game=models.OuterRef('pk'))))
+
+
+class OpenGamesManager(models.Manager.from_queryset(GameQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(started__isnull=True)
 
@@ -20,19 +33,64 @@ class Game(models.Model):
     rounds_number = models.IntegerField(null=True, blank=True, default=None)
 
     players = models.ManyToManyField(
-        User, blank=True, related_name='games'
+        User, blank=True, related_name='games', through='Membership'
     )
 
     started = models.DateTimeField(null=True, blank=True, default=None)
     ended = models.DateTimeField(null=True, blank=True, default=None)
 
+    # players that will be nosy next, in order; drawn at start (plan_nosies) and
+    # consumed by next_nosy, disqualified players are taken out by add_faults
+    nosy_plan = models.JSONField(default=list, blank=True)
+
+    # latest round, kept by next_round so it can be joined instead of searched
+    current_round = models.ForeignKey('Round', on_delete=models.SET_NULL, null=True, blank=True, default=None,
+                                      related_name='+')
+
+    # bumped on every write that changes the game state (see bump_version)
+    version = models.PositiveIntegerField(default=0)
+
+    # pending phase timer, fired by trivia_api.orchestrator.Orchestrator
+    TIMERS = [
+        ('start', 'START'),
+        ('question', 'QUESTION'),
+        ('answer', 'ANSWER'),
+        ('qualify', 'QUALIFY'),
+        ('assess', 'ASSESS'),
+    ]
+    timer = models.CharField(max_length=8, choices=TIMERS, null=True, blank=True, default=None)
+    deadline = models.DateTimeField(null=True, blank=True, default=None, db_index=True)
+
     # managers
-    objects = models.Manager()
+    objects = GameQuerySet.as_manager()
     open = OpenGamesManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created'], condition=models.Q(started__isnull=True), name='game_open_idx'),
+        ]
+
     def __str__(self):
         return f'{self.name} [{self.creator}]'
 
+    def save(self, *args, **kwargs):
+        bumped = self.pk is not None
+        if bumped:
+            self.version = models.F('version') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+
+        super().save(*args, **kwargs)
+
+        if bumped:
+            self.refresh_from_db(fields=['version'])
+
+    def bump_version(self):
+        Game.objects.filter(pk=self.pk).update(version=models.F('version') + 1)
+
+    async def abump_version(self):
+        await Game.objects.filter(pk=self.pk).aupdate(version=models.F('version') + 1)
+
     @property
     def players_count(self):
         return self.players.count()
@@ -43,35 +101,31 @@ class Game(models.Model):
 
     @property
     def remaining_rounds(self):
-        return self.rounds_number - self.rounds.count() if self.rounds_number is not None else None
+        return self.rounds_number - self.current_round_idx if self.rounds_number is not None else None
 
     @property
     def current_round_idx(self):
-        return self.rounds.count()
-
-    @property
-    def current_round(self):
-        if self.rounds.count() > 0:
-            return self.rounds.latest('started')
-        else:
-            return None
+        return self.current_round.number if self.current_round_id is not None else 0
 
     @property
     def active_players(self):
-        return [p for p in self.players.all() if self.player_faults(p.id) < 3]
+        return [m.player for m in self.memberships.filter(disqualified=False).select_related('player')]
 
     @property
     def disqualified_players(self):
-        return [p for p in self.players.all() if self.player_faults(p.id) >= 3]
+        return [m.player for m in self.memberships.filter(disqualified=True).select_related('player')]
 
     def next_round(self):
         if self.remaining_rounds > 0:
-            Round.objects.create(game=self,
-                                 nosy=self.next_nosy(),
-                                 started=datetime.datetime.now())
-            return True
+            c_round = Round.objects.create(game=self,
+                                           number=self.current_round_idx + 1,
+                                           nosy_id=self.next_nosy(),
+                                           started=datetime.datetime.now())
+            self.current_round = c_round
+            self.save(update_fields=['current_round', 'nosy_plan'])
+            return c_round
         else:
-            return False
+            return None
 
     def restart_round(self):
         c_round = self.current_round
@@ -80,53 +134,107 @@ class Game(models.Model):
             c_round.save()
 
             c_round.started = datetime.datetime.now()
-            c_round.nosy = self.next_nosy()
+            c_round.nosy_id = self.next_nosy()
             c_round.save()
+            self.save(update_fields=['nosy_plan'])
 
-    def next_nosy(self):
+        return c_round
+
+    def plan_nosies(self, player_ids):
         # random without repeat
-        p_ready = [r.nosy.id for r in self.rounds.all() if r.nosy is not None]
-        p_available = [p for p in self.active_players if p.id not in p_ready]
+        self.nosy_plan = random.sample(list(player_ids), len(player_ids))
+        return self.nosy_plan
 
-        if len(p_available) > 0:
-            return random.choice(p_available)
+    def next_nosy(self):
+        # id of the next nosy; the caller saves nosy_plan
+        if len(self.nosy_plan) > 0:
+            return self.nosy_plan.pop(0)
         else:
-            scores = [{'player': p, 'score': self.player_score(p.id)} for p in self.active_players]
-            scores.sort(key=lambda p: p['score'])
+            scores = list(self.memberships.filter(disqualified=False).order_by('score')
+                          .values_list('player', flat=True)[:2])
 
-            last_nosy = self.current_round.nosy
+            last_nosy = self.current_round.nosy_id
 
-            return scores[0]['player'] if last_nosy is None or scores[0]['player'].id != last_nosy.id else scores[1]['player']
+            return scores[0] if last_nosy is None or scores[0] != last_nosy else scores[1]
 
     def player_score(self, p_id):
-        answering = Move.objects.filter(
-            round__game=self, player=p_id, evaluation__isnull=False
-        ).aggregate(models.Sum('evaluation'))
-        answering_score = answering['evaluation__sum'] if answering['evaluation__sum'] is not None else 0
-        asking = sum([r.nosy_score if r.nosy_score is not None else 0 for r in self.rounds.filter(nosy=p_id).all()])
-
-        return answering_score + asking
+        return self.player_counter(p_id, 'score')
 
     def player_faults(self, p_id):
-        fault_count = Fault.objects.filter(round__game=self, player=p_id).aggregate(models.Sum('fault_value'))
-        return fault_count['fault_value__sum'] if fault_count['fault_value__sum'] is not None else 0
+        return self.player_counter(p_id, 'faults')
 
     def player_errors(self, p_id):
-        errors_count = ActionError.objects.filter(round__game=self, player=p_id).count()
-        return errors_count if errors_count is not None else 0
+        return self.player_counter(p_id, 'errors')
+
+    def player_counter(self, p_id, counter):
+        value = self.memberships.filter(player=p_id).values_list(counter, flat=True).first()
+        return value if value is not None else 0
 
     def get_scores(self):
-        return {p.id: self.player_score(p.id) for p in self.players.all()}
+        return dict(self.memberships.values_list('player', 'score'))
 
     def is_disqualified(self, player_id):
-        return self.player_faults(player_id) >= 3
+        return self.memberships.filter(player=player_id, disqualified=True).exists()
+
+    def disqualified_among(self, player_ids):
+        return list(self.memberships.filter(player__in=player_ids, disqualified=True)
+                    .values_list('player', flat=True))
+
+    def add_score(self, player_id, points):
+        self.add_scores([player_id], points)
+
+    def add_scores(self, player_ids, points):
+        if points and player_ids:
+            self.memberships.filter(player__in=player_ids).update(score=models.F('score') + points)
+            self.bump_version()
+
+    def add_fault(self, player_id, fault_value):
+        self.add_faults([player_id], fault_value)
+
+    def add_faults(self, player_ids, fault_value):
+        # the update reads the previous total, so the player is disqualified once it reaches 3
+        self.memberships.filter(player__in=player_ids).update(
+            faults=models.F('faults') + fault_value,
+            disqualified=models.Case(
+                models.When(faults__gte=3 - fault_value, then=models.Value(True)),
+                default=models.F('disqualified')
+            )
+        )
+        self.bump_version()
+
+        planned = [p for p in player_ids if p in self.nosy_plan]
+        if len(planned) > 0:
+            disqualified = self.disqualified_among(planned)
+            if len(disqualified) > 0:
+                self.nosy_plan = [p for p in self.nosy_plan if p not in disqualified]
+                self.save(update_fields=['nosy_plan'])
+
+    def add_error(self, player_id):
+        self.memberships.filter(player=player_id).update(errors=models.F('errors') + 1)
+        self.bump_version()
+
+
+class Membership(models.Model):
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='memberships')
+    player = models.ForeignKey(User, on_delete=models.CASCADE, related_name='memberships')
+
+    # running counters, kept in sync by the writes on Round and Move
+    score = models.IntegerField(default=0)
+    faults = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    disqualified = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('game', 'player')
 
-    def round_index(self, the_round):
-        return self.rounds.filter(started__lte=the_round.started).count()
+    def __str__(self):
+        return f'{self.player} [{self.game}]'
 
 
 class Round(models.Model):
-    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='rounds')
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='rounds', db_index=False)
+    # position in the game, starting at 1, set once by Game.next_round
+    number = models.PositiveIntegerField()
 
     nosy = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, default=None)
     question = models.TextField(null=True, blank=True, default=None)
@@ -137,20 +245,28 @@ class Round(models.Model):
     qualify_ended = models.DateTimeField(null=True, blank=True, default=None)
     ended = models.DateTimeField(null=True, blank=True, default=None)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['game', 'started'], name='round_game_started_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'number'], name='round_game_number_unique'),
+        ]
+
     def __str__(self):
         return f'{self.started} [{self.game}]'
 
-    @property
-    def index(self):
-        return self.game.round_index(self)
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Game.objects.filter(pk=self.game_id).update(version=models.F('version') + 1)
 
     @property
-    def players_without_nosy(self):
-        return [p for p in self.game.active_players if p.id != self.nosy.id]
+    def index(self):
+        return self.number
 
     @property
     def missing_players(self):
-        move_players = [m.player.id for m in self.moves.all()]
+        move_players = set(self.moves.values_list('player_id', flat=True))
 
         return [p for p in self.game.active_players if p.id not in move_players]
 
@@ -164,7 +280,7 @@ class Round(models.Model):
 
     @property
     def missing_qualifications_players(self):
-        return [q.player for q in self.qualifications.filter(qualified__isnull=True).all()]
+        return [q.player for q in self.qualifications.filter(qualified__isnull=True).select_related('player')]
 
     @property
     def correct_answer(self):
@@ -194,17 +310,21 @@ class Round(models.Model):
             negative = Qualification.objects.filter(move__round=self, is_correct=False).count()
             qualifications = Qualification.objects.filter(move__round=self).count()
 
-            if qualifications > 0:
-                if (qualifications-negative)/qualifications >= 0.8:
-                    return 3
-                elif (qualifications-negative)/qualifications >= 0.5:
-                    return 1
-                return -2
-            else:
-                return 3
+            return self.score_for_nosy(qualifications, negative)
         else:
             return None
 
+    @staticmethod
+    def score_for_nosy(qualifications, negative):
+        if qualifications > 0:
+            if (qualifications-negative)/qualifications >= 0.8:
+                return 3
+            elif (qualifications-negative)/qualifications >= 0.5:
+                return 1
+            return -2
+        else:
+            return 3
+
     def add_answer(self, player, answer):
         if self.moves.filter(player=player).count() == 0:
             move = Move.objects.create(round=self,
@@ -217,47 +337,71 @@ class Round(models.Model):
     def add_answer_evaluation(self, player, grade):
         move = self.moves.filter(player=player).first()
         if move is not None:
-            move.evaluation = grade
-            move.evaluated = datetime.datetime.now()
-            move.save()
+            previous = move.evaluation if move.evaluation is not None else 0
+            with transaction.atomic():
+                move.evaluation = grade
+                move.evaluated = datetime.datetime.now()
+                move.save()
+                self.game.add_score(move.player_id, grade - previous)
             return True
 
         return False
 
     def close_evaluations(self):
-        for m in self.missing_evaluations:
-            m.auto_grade()
+        # ungraded moves get the full 2 points, all in one update
+        with transaction.atomic():
+            moves = self.moves.filter(evaluation__isnull=True).exclude(player=self.nosy)
+            player_ids = list(moves.select_for_update().values_list('player_id', flat=True))
+            self.moves.filter(player__in=player_ids).update(evaluation=2, auto_evaluation=True,
+                                                            evaluated=datetime.datetime.now())
+            self.game.add_scores(player_ids, 2)
 
     def create_qualifications(self):
-        if self.qualifications.count() == 0 and self.moves_count > 0:
-            valid_moves = list(self.moves.exclude(player=self.nosy).order_by('created'))
-            next_move = 0
-            for p in self.players_without_nosy:
-                if valid_moves[next_move].player.id == p.id:
-                    valid_moves[next_move], valid_moves[(next_move+1) % len(valid_moves)] = valid_moves[(next_move+1) % len(valid_moves)], valid_moves[next_move]
-                p_move = valid_moves[next_move]
-                Qualification.objects.create(player=p,
-                                             move=p_move)
-                next_move = (next_move+1) % len(valid_moves)
+        if not self.qualifications.exists():
+            moves = list(self.moves.exclude(player=self.nosy_id).order_by('created').values_list('id', 'player_id'))
+            reviewers = self.game.memberships.filter(disqualified=False).exclude(player=self.nosy_id) \
+                .order_by('id').values_list('player_id', flat=True)
+
+            Qualification.objects.bulk_create([Qualification(player_id=player_id, move_id=move_id)
+                                               for player_id, move_id in assign_reviews(reviewers, moves)])
+
+    def end(self):
+        with transaction.atomic():
+            self.ended = datetime.datetime.now()
+            self.save()
+            if self.nosy is not None:
+                self.game.add_score(self.nosy.id, self.nosy_score)
 
     def create_fault(self, player_id, category):
-        fault_value = 1 if category != 'QT' else 2
+        return self.create_faults([player_id], category)[0]
 
-        fault = Fault.objects.create(round=self,
-                                     player=User.objects.get(id=player_id),
-                                     category=category,
-                                     fault_value=fault_value)
-        return fault
+    def create_faults(self, player_ids, category):
+        fault_value = 1 if category != 'QT' else 2
 
-    def get_qualification(self, playerid):
-        return Qualification.objects.filter(player__id=playerid, move__round=self).first()
+        with transaction.atomic():
+            faults = Fault.objects.bulk_create([Fault(round=self,
+                                                      player_id=player_id,
+                                                      category=category,
+                                                      fault_value=fault_value) for player_id in player_ids])
+            self.game.add_faults(player_ids, fault_value)
+        return faults
+
+    def create_error(self, player, action, error_message):
+        with transaction.atomic():
+            error = ActionError.objects.create(player=player,
+                                               round=self,
+                                               action=action,
+                                               error_message=error_message)
+            self.game.add_error(player.id)
+        return error
 
     def get_results(self):
         if self.ended is not None:
             results = {p.id: 0 if p.id != self.nosy.id else self.nosy_score for p in self.game.active_players}
 
-            for m in self.moves.filter(evaluation__isnull=False).all():
-                results[m.player.id] = m.evaluation
+            for player_id, evaluation in self.moves.filter(evaluation__isnull=False).values_list('player_id',
+                                                                                                'evaluation'):
+                results[player_id] = evaluation
 
             return results
         else:
@@ -265,7 +409,7 @@ class Round(models.Model):
 
 
 class Move(models.Model):
-    round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name='moves')
+    round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name='moves', db_index=False)
     player = models.ForeignKey(User, on_delete=models.CASCADE)
     answer = models.TextField(null=True, blank=True, default=None)
     evaluation = models.IntegerField(null=True, blank=True, default=None)
@@ -274,25 +418,30 @@ class Move(models.Model):
     created = models.DateTimeField(auto_now_add=True, blank=True)
     evaluated = models.DateTimeField(null=True, blank=True, default=None)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['round', 'player'], name='move_round_player_idx'),
+            models.Index(fields=['round'], condition=models.Q(evaluation__isnull=True),
+                         name='move_round_unevaluated_idx'),
+        ]
+
     def __str__(self):
         return f'{self.player} [{self.round}]'
 
-    def auto_grade(self):
-        self.evaluation = 2
-        self.auto_evaluation = True
-        self.evaluated = datetime.datetime.now()
-
-        self.save()
-
 
 class Qualification(models.Model):
-    player = models.ForeignKey(User, on_delete=models.CASCADE, related_name='qualifications')
+    player = models.ForeignKey(User, on_delete=models.CASCADE, related_name='qualifications', db_index=False)
     move = models.ForeignKey(Move, on_delete=models.CASCADE, related_name='qualifications')
     is_correct = models.BooleanField(null=True, blank=True, default=None)
 
     created = models.DateTimeField(auto_now_add=True, blank=True)
     qualified = models.DateTimeField(null=True, blank=True, default=None)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['player', 'move'], name='qualification_player_move_idx'),
+        ]
+
     def __str__(self):
         return f'{self.player} [{self.move}] -- {self.is_correct}'
 
@@ -306,11 +455,16 @@ class Fault(models.Model):
         ('FF', 'FOCUS'),
     ]
 
-    player = models.ForeignKey(User, on_delete=models.CASCADE, related_name='faults')
+    player = models.ForeignKey(User, on_delete=models.CASCADE, related_name='faults', db_index=False)
     round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name='faults')
     category = models.CharField(max_length=2, choices=FAULT_CATEGORIES)
     fault_value = models.IntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['player', 'round'], name='fault_player_round_idx'),
+        ]
+
     def __str__(self):
         return f'{self.player} [{self.round}]'
 
@@ -326,3 +480,39 @@ class ActionError(models.Model):
 
     def __str__(self):
         return f'{self.player} [{self.round.game}] -- {self.action}'
+
+
+class GameEvent(models.Model):
+    # journal of the game messages when settings.TRIVIA_JOURNAL_DB is set (see trivia_api.journal),
+    # the id is the seq the clients resume from; user is set for messages sent to a single player
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='events', db_index=False)
+    user = models.ForeignKey(User, null=True, blank=True, default=None, on_delete=models.CASCADE,
+                             related_name='+', db_index=False)
+    message = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['game', 'id'], name='gameevent_game_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.game_id} #{self.id} -- {self.message.get("type")}'
+
+
+class ChannelGroup(models.Model):
+    # group membership for trivia_api.layers.PostgresChannelLayer
+    group_name = models.CharField(max_length=100)
+    channel_name = models.CharField(max_length=100)
+    expires = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('group_name', 'channel_name')
+
+    def __str__(self):
+        return f'{self.group_name} -> {self.channel_name}'
+
+
+class ChannelMessage(models.Model):
+    # messages too large to travel inside a NOTIFY payload
+    payload = models.TextField()
+    created = models.DateTimeField(auto_now_add=True, blank=True)
@@ -0,0 +1,97 @@
+import asyncio
+import traceback
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from trivia_api.engine import GameEngine
+
+
+class Orchestrator:
+    # Deadline-driven scheduler for the phase timers of every active game. A timer
+    # is claimed with a conditional update before it fires, so any number of
+    # orchestrators (in-process or `manage.py run_orchestrator`) can run at once and
+    # each timer fires exactly once.
+    POLL_INTERVAL = 1
+
+    def __init__(self, channel_layer=None):
+        self.channel_layer = channel_layer if channel_layer is not None else get_channel_layer()
+        self.next_deadline = None
+        self.wakeup = asyncio.Event()
+        self.tasks = set()
+        self.loop = None
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                timers, self.next_deadline = await self.claim_due_timers()
+            except Exception:
+                traceback.print_exc()
+                timers = []
+
+            for game_id, timer in timers:
+                task = asyncio.create_task(self.fire(game_id, timer))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+            timeout = self.POLL_INTERVAL
+            if self.next_deadline is not None:
+                timeout = min(max((self.next_deadline - timezone.now()).total_seconds(), 0), timeout)
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    def wake(self, deadline):
+        if self.next_deadline is None or deadline < self.next_deadline:
+            self.next_deadline = deadline
+            self.wakeup.set()
+
+    async def fire(self, game_id, timer):
+        try:
+            await GameEngine(game_id, self.channel_layer).on_timer(timer)
+        except Exception:
+            traceback.print_exc()
+
+    @database_sync_to_async
+    def claim_due_timers(self):
+        from trivia_api.models import Game
+
+        now = timezone.now()
+        claimed = []
+        for game_id, timer, deadline in Game.objects.filter(deadline__lte=now).values_list('id', 'timer', 'deadline'):
+            if Game.objects.filter(id=game_id, timer=timer, deadline=deadline).update(timer=None, deadline=None):
+                claimed.append((game_id, timer))
+
+        next_deadline = Game.objects.filter(deadline__isnull=False).order_by('deadline') \
+            .values_list('deadline', flat=True).first()
+
+        return claimed, next_deadline
+
+
+_orchestrator = None
+
+
+def start_orchestrator():
+    # Runs an orchestrator inside this worker unless an external one was configured.
+    global _orchestrator
+
+    if settings.TRIVIA_EXTERNAL_ORCHESTRATOR:
+        return
+
+    loop = asyncio.get_running_loop()
+    if _orchestrator is None or _orchestrator.loop is not loop:
+        _orchestrator = Orchestrator()
+        _orchestrator.loop = loop
+        _orchestrator.task = loop.create_task(_orchestrator.run())
+
+
+def wake_orchestrator(deadline):
+    if _orchestrator is not None and _orchestrator.loop is asyncio.get_running_loop():
+        _orchestrator.wake(deadline)
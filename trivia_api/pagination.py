@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class GamePagination(CursorPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = '-created'
+
+
+class FirstPagePagination(GamePagination):
+    # the first page whatever the cursor or page_size of the request, for lists embedded in another response
+    def get_page_size(self, request):
+        return self.page_size
+
+    def decode_cursor(self, request):
+        return None
@@ -12,38 +12,30 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class PlayerSerializer(serializers.ModelSerializer):
-    games_created = serializers.SerializerMethodField()
-    games_joined = serializers.SerializerMethodField()
+    # annotated by ProfileView
+    games_created_count = serializers.IntegerField(read_only=True)
+    games_joined_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'games_created', 'games_joined']
-
-    def get_games_created(self, obj):
-        return GameLightSerializer(
-            Game.objects.filter(creator=obj).all(),
-            many=True
-        ).data
-
-    def get_games_joined(self, obj):
-        return GameLightSerializer(
-            Game.objects.filter(players__id=obj.id).all(),
-            many=True
-        ).data
+        fields = ['id', 'username', 'games_created_count', 'games_joined_count']
 
 
 class GameSerializer(serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
     created = serializers.DateTimeField(read_only=True)
-    player_count = serializers.IntegerField(
-        source='players.count', read_only=True
-    )
+    player_count = serializers.SerializerMethodField()
     players = UserSerializer(read_only=True, many=True)
     i_can_start = serializers.SerializerMethodField()
 
     class Meta:
         model = Game
-        fields = '__all__'
+        # bookkeeping of the game engine is neither shown nor writable
+        exclude = ['version', 'timer', 'deadline', 'current_round', 'nosy_plan']
+
+    def get_player_count(self, obj):
+        # annotated by GameViewSet.get_queryset, counted for a game just created
+        return obj.player_count if hasattr(obj, 'player_count') else obj.players.count()
 
     def get_i_can_start(self, obj):
         if obj.creator.id == self.context['request'].user.id:
@@ -79,11 +71,10 @@ class GameSerializer(serializers.ModelSerializer):
 
 
 class GameLightSerializer(serializers.ModelSerializer):
+    # expects games from Game.objects.with_player_count()
     creator = UserSerializer(read_only=True)
     created = serializers.DateTimeField(read_only=True)
-    player_count = serializers.IntegerField(
-        source='players.count', read_only=True
-    )
+    player_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Game
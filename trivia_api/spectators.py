@@ -0,0 +1,108 @@
+import asyncio
+import json
+import traceback
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+
+from trivia_api.cache import PROCESS_ID
+from trivia_api.layers import group_send_many
+from trivia_api.metrics import channel_sends
+from trivia_api.states import cached_game_state
+
+
+def snapshot_text(game):
+    # encoded once and sent as is to every spectator
+    return json.dumps({
+        'type': 'game_snapshot',
+        'game': game.id,
+        'version': game.version,
+        'state': cached_game_state(game),
+    }, cls=DjangoJSONEncoder)
+
+
+class SpectatorFeed:
+    # Sends the spectators connected to this process at most one snapshot per game
+    # and tick, and only when the game version changed. Spectators are in their own
+    # group, scoped to the process so that each feed reaches only its own
+    # spectators, and never receive the player messages of the game group.
+    TICK = 1
+
+    def __init__(self, channel_layer=None):
+        self.channel_layer = channel_layer if channel_layer is not None else get_channel_layer()
+        self.watchers = Counter()
+        self.versions = {}
+        self.loop = None
+
+    def group(self, game_id):
+        return f'game_{game_id}_spectators_{PROCESS_ID}'
+
+    def watch(self, game_id, version):
+        # a new spectator got the snapshot of this version when it connected
+        self.watchers[game_id] += 1
+        self.versions.setdefault(game_id, version)
+
+    def unwatch(self, game_id):
+        self.watchers[game_id] -= 1
+        if self.watchers[game_id] <= 0:
+            del self.watchers[game_id]
+            self.versions.pop(game_id, None)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+
+        while True:
+            start = self.loop.time()
+            try:
+                if self.watchers:
+                    await self.tick()
+            except Exception:
+                traceback.print_exc()
+
+            await asyncio.sleep(max(self.TICK - (self.loop.time() - start), 0))
+
+    async def tick(self):
+        changed = await self.changed_snapshots(list(self.watchers))
+
+        group_messages = []
+        for game_id, version, text in changed:
+            if game_id in self.watchers:
+                self.versions[game_id] = version
+                group_messages.append((self.group(game_id), {'type': "spectator_message", 'text': text}))
+
+        channel_sends.inc('spectators', amount=len(group_messages))
+        await group_send_many(self.channel_layer, group_messages)
+
+    @database_sync_to_async
+    def changed_snapshots(self, game_ids):
+        from trivia_api.models import Game
+
+        changed = []
+        games = {g.id: g for g in Game.objects.filter(id__in=game_ids).select_related('current_round')}
+        for game_id in game_ids:
+            game = games.get(game_id)
+            if game is None:
+                if self.versions.get(game_id) is not None:
+                    changed.append((game_id, None, json.dumps({'type': 'game_deleted', 'game': game_id})))
+            elif self.versions.get(game_id) != game.version:
+                changed.append((game_id, game.version, snapshot_text(game)))
+
+        return changed
+
+
+_feed = None
+
+
+def start_spectator_feed():
+    # One feed per worker, started by the first spectator.
+    global _feed
+
+    loop = asyncio.get_running_loop()
+    if _feed is None or _feed.loop is not loop:
+        _feed = SpectatorFeed()
+        _feed.loop = loop
+        _feed.task = loop.create_task(_feed.run())
+
+    return _feed
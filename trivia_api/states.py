@@ -0,0 +1,108 @@
+import threading
+
+from django.core.cache import cache
+
+from trivia_api.models import Membership
+
+STATE_CACHE_TIMEOUT = 300
+STATE_WAIT_TIMEOUT = 10
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def build_games_state(games):
+    # Full state of several games with a fixed number of queries: the games with
+    # their creator and current round, and their memberships.
+    games = list(games.select_related('creator', 'current_round'))
+
+    players = {g.id: [] for g in games}
+    for m in Membership.objects.filter(game__in=players.keys()).select_related('player').order_by('id'):
+        players[m.game_id].append({
+            'id': m.player.id,
+            'username': m.player.username,
+            'score': m.score,
+            'faults': m.faults,
+            'errors': m.errors,
+        })
+
+    games_state = []
+    for game in games:
+        c_round = game.current_round
+        games_state.append({
+            'id': game.id,
+            'name': game.name,
+            'rounds': game.rounds_number,
+            'question_time': game.question_time,
+            'answer_time': game.answer_time,
+            'creator': game.creator.username,
+            'current_round': game.current_round_idx,
+            'round': {
+                'started': c_round.started,
+                'nosy': c_round.nosy_id,
+                'question': c_round.question,
+                'phase': c_round.current_phase,
+            } if c_round is not None else None,
+            'players': players[game.id],
+            'started': game.started,
+            'ended': game.ended,
+        })
+
+    return games_state
+
+
+def build_game_state(game):
+    c_round = game.current_round
+
+    return {
+        'rounds': game.rounds_number,
+        'current_round': game.current_round_idx,
+        'round': {
+            'nosy': c_round.nosy_id,
+            'question': c_round.question,
+            'phase': c_round.current_phase,
+        } if c_round is not None else None,
+        'players': [
+            {
+                'id': m.player.id,
+                'username': m.player.username,
+                'score': m.score,
+                'faults': m.faults}
+            for m in game.memberships.select_related('player').order_by('id')
+        ],
+        'ended': game.ended,
+    }
+
+
+def game_state_etag(game):
+    return f'"{game.id}-{game.version}"'
+
+
+def cached_game_state(game):
+    # The payload is cached per game version. Concurrent requests for the same version
+    # wait for the first one to build it instead of all hitting the database.
+    key = f'game_state:{game.id}:{game.version}'
+
+    game_state = cache.get(key)
+    if game_state is not None:
+        return game_state
+
+    with _inflight_lock:
+        event = _inflight.get(key)
+        leader = event is None
+        if leader:
+            event = _inflight[key] = threading.Event()
+
+    if leader:
+        try:
+            game_state = build_game_state(game)
+            cache.set(key, game_state, STATE_CACHE_TIMEOUT)
+        finally:
+            with _inflight_lock:
+                del _inflight[key]
+            event.set()
+        return game_state
+
+    event.wait(STATE_WAIT_TIMEOUT)
+    game_state = cache.get(key)
+    return game_state if game_state is not None else build_game_state(game)
@@ -1,3 +1,448 @@
-from django.test import TestCase
+import asyncio
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from trivia_api.cache import get_game_state, invalidate_game_state
+from trivia_api.consumers import TriviaConsumer
+from trivia_api.engine import GameEngine
+from trivia_api.indexes import check_indexes
+from trivia_api.layers import PostgresChannelLayer
+from trivia_api.middlewares import user_cache
+from trivia_api.models import ActionError, Fault, Game, Membership, Move, Qualification, Round
+
+# Every budget must hold for all of these sizes (players per game, games per list)
+SIZES = [3, 8, 20]
+
+
+def seed_users(prefix, size):
+    return [User.objects.create_user(f'{prefix}_{i}') for i in range(size)]
+
+
+def seed_game(creator, players, **kwargs):
+    game = Game.objects.create(name=f'game {creator.username}', creator=creator, **kwargs)
+    Membership.objects.bulk_create([Membership(game=game, player=p) for p in [creator, *players]])
+    return game
+
+
+class QueryBudgetMixin:
+    def assertQueryBudget(self, queries, budget, label):
+        if len(queries) > budget:
+            self.fail(f'{label} made {len(queries)} queries, budget is {budget}:\n' +
+                      '\n'.join(f'  {i}. {q["sql"]}' for i, q in enumerate(queries, 1)))
+
+
+class capture_queries:
+    # CaptureQueriesContext for async tests, entered in the thread that runs their ORM calls
+    async def __aenter__(self):
+        self.context = CaptureQueriesContext(connection)
+        self.queries = []
+        await sync_to_async(self.context.__enter__)()
+        return self.queries
+
+    async def __aexit__(self, *exc_info):
+        await sync_to_async(self.context.__exit__)(*exc_info)
+        self.queries += await sync_to_async(lambda: self.context.captured_queries)()
+
+
+class HandledConsumer(TriviaConsumer):
+    # tells the test when an action has been completely handled
+    handled = None
+
+    async def receive_json(self, content=None):
+        await super().receive_json(content)
+        await self.handled.put(content['action'])
+
+
+class WithUser:
+    def __init__(self, inner, user):
+        self.inner = inner
+        self.user = user
+
+    async def __call__(self, scope, receive, send):
+        return await self.inner(dict(scope, user=self.user), receive, send)
+
+
+class ConsumerMixin(QueryBudgetMixin):
+    # plays games through HandledConsumer sockets, timers are fired by the test
+    def setUp(self):
+        self.router = URLRouter([path('ws/trivia/<int:game_id>/', HandledConsumer.as_asgi())])
+
+    async def connect(self, game, users):
+        sockets = {}
+        for user in users:
+            socket = WebsocketCommunicator(WithUser(self.router, user), f'/ws/trivia/{game.id}/')
+            async with capture_queries() as queries:
+                connected, _ = await socket.connect()
+            self.assertTrue(connected)
+            self.assertQueryBudget(queries, self.BUDGETS['connect'], 'connect')
+            sockets[user.id] = socket
+        return sockets
+
+    async def act(self, socket, content, size):
+        async with capture_queries() as queries:
+            await socket.send_json_to(content)
+            await asyncio.wait_for(HandledConsumer.handled.get(), 5)
+        self.assertQueryBudget(queries, self.BUDGETS[content['action']], f'{content["action"]} with {size} players')
+
+    async def fire(self, game, timer, size):
+        async with capture_queries() as queries:
+            await GameEngine(game.id).on_timer(timer)
+        self.assertQueryBudget(queries, self.BUDGETS[f'timer {timer}'], f'{timer} timer with {size} players')
+
+    async def start_game(self, size):
+        HandledConsumer.handled = asyncio.Queue()
+        users = await sync_to_async(seed_users)(f'p{size}', size)
+        game = await sync_to_async(seed_game)(users[0], users[1:])
+        invalidate_game_state(game.id)
+
+        sockets = await self.connect(game, users)
+        await self.act(sockets[users[0].id], {'action': 'start', 'rounds': size}, size)
+        await self.fire(game, 'start', size)
+        return game, users, sockets
+
+    async def close(self, sockets):
+        for socket in sockets.values():
+            await socket.disconnect()
+
+    @sync_to_async
+    def current_round(self, game):
+        return Round.objects.filter(game=game).order_by('-number').first()
+
+    @sync_to_async
+    def reviewers(self, c_round):
+        return list(Qualification.objects.filter(move__round=c_round).values_list('player_id', flat=True))
+
+
+# channels' database_sync_to_async closes connections, which the transaction of TestCase does not allow
+@override_settings(TRIVIA_EXTERNAL_ORCHESTRATOR=True)
+class ConsumerQueryBudgetTests(ConsumerMixin, TransactionTestCase):
+    BUDGETS = {
+        'connect': 1,
+        'start': 4,
+        'question': 3,
+        'answer': 2,
+        'qualify': 5,
+        'assess': 1,
+        'timer start': 7,
+        'timer question': 15,
+        'timer answer': 22,
+        'timer qualify': 22,
+        'timer assess': 21,
+    }
+
+    async def test_round(self):
+        for size in SIZES:
+            game, users, sockets = await self.start_game(size)
+            c_round = await self.current_round(game)
+
+            await self.act(sockets[c_round.nosy_id], {'action': 'question', 'text': '¿Pregunta?'}, size)
+            players = [u.id for u in users if u.id != c_round.nosy_id]
+            for user_id in players:
+                await self.act(sockets[user_id], {'action': 'answer', 'text': f'respuesta {user_id}'}, size)
+            for user_id in players:
+                await self.act(sockets[c_round.nosy_id], {'action': 'qualify', 'userid': user_id, 'grade': 3}, size)
+
+            await self.fire(game, 'answer', size)
+            for user_id in await self.reviewers(c_round):
+                await self.act(sockets[user_id], {'action': 'assess', 'correctness': 'true'}, size)
+            await self.fire(game, 'assess', size)
+
+            await self.close(sockets)
+
+    async def test_timeouts(self):
+        # nobody asks, then nobody grades
+        for size in SIZES:
+            game, users, sockets = await self.start_game(size + 1)
+            await self.fire(game, 'question', size + 1)
+
+            c_round = await self.current_round(game)
+            await self.act(sockets[c_round.nosy_id], {'action': 'question', 'text': '¿Pregunta?'}, size + 1)
+            for user in users:
+                if user.id != c_round.nosy_id:
+                    await self.act(sockets[user.id], {'action': 'answer', 'text': 'respuesta'}, size + 1)
+            await self.fire(game, 'answer', size + 1)
+            await self.fire(game, 'qualify', size + 1)
+
+            await self.close(sockets)
+
+
+
+@override_settings(TRIVIA_EXTERNAL_ORCHESTRATOR=True)
+class PhaseTimerTests(ConsumerMixin, TransactionTestCase):
+    # the last grade after the answer time also closes the qualify phase
+    BUDGETS = dict(ConsumerQueryBudgetTests.BUDGETS, qualify=16)
+
+    async def answered_round(self):
+        game, users, sockets = await self.start_game(3)
+        c_round = await self.current_round(game)
+        players = [u.id for u in users if u.id != c_round.nosy_id]
+
+        await self.act(sockets[c_round.nosy_id], {'action': 'question', 'text': '¿Pregunta?'}, 3)
+        for user_id in players:
+            await self.act(sockets[user_id], {'action': 'answer', 'text': 'respuesta'}, 3)
+        return game, sockets, sockets[c_round.nosy_id], players
+
+    @sync_to_async
+    def game_timer(self, game):
+        game = Game.objects.select_related('current_round').get(id=game.id)
+        return game.timer, game.current_round.current_phase
+
+    async def test_late_qualify_timer_keeps_assess_timer(self):
+        # the nosy grades the last answer between the answer timeout's check and its set_timer
+        game, sockets, nosy, players = await self.answered_round()
+        engine = GameEngine(game.id)
+        await engine.answer_ended()
+        for user_id in players:
+            await self.act(nosy, {'action': 'qualify', 'userid': user_id, 'grade': 3}, 3)
+
+        await engine.set_timer('qualify', engine.QUALIFY_TIME)
+        self.assertEqual(await self.game_timer(game), ('assess', 'evaluating'))
+        await self.close(sockets)
+
+    async def test_qualify_timeout_ends_graded_round(self):
+        # every answer was graded but the qualify phase was not closed
+        game, sockets, nosy, players = await self.answered_round()
+        for user_id in players:
+            await self.act(nosy, {'action': 'qualify', 'userid': user_id, 'grade': 3}, 3)
+        await GameEngine(game.id).answer_ended()
+
+        await self.fire(game, 'qualify', 3)
+        self.assertEqual(await self.game_timer(game), ('assess', 'evaluating'))
+        await self.close(sockets)
+
+class ApiQueryBudgetTests(QueryBudgetMixin, TestCase):
+    BUDGETS = {
+        'list': 2,
+        'list light': 1,
+        'retrieve': 2,
+        'create': 5,
+        'update': 6,
+        'partial_update': 6,
+        'destroy': 6,
+        'recent_states': 2,
+        'states': 2,
+        'tournament': 6,
+        'profile': 3,
+        'profile games_created': 1,
+        'profile games_joined': 1,
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, size):
+        # size open games and size started ones of size players, all created by the first user
+        users = seed_users(f'u{size}', size)
+        games = [seed_game(users[0], users[1:]) for _ in range(size)]
+        started = [seed_game(users[0], users[1:], started=timezone.now()) for _ in range(size)]
+
+        client = APIClient()
+        client.force_authenticate(users[0])
+        return users, games, started, client
+
+    def request(self, client, method, url, label, size, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, format='json', **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        self.assertQueryBudget(queries, self.BUDGETS[label], f'{label} with size {size}')
+        return response
+
+    def test_games(self):
+        for size in SIZES:
+            users, games, started, client = self.seed(size)
+
+            self.request(client, 'get', '/api/games/', 'list', size)
+            self.request(client, 'get', '/api/games/?view=light', 'list light', size)
+            self.request(client, 'get', f'/api/games/{games[0].id}/', 'retrieve', size)
+            self.request(client, 'post', '/api/games/', 'create', size, data={'name': 'nuevo'})
+            get_game_state(games[0].id)
+            self.request(client, 'put', f'/api/games/{games[0].id}/', 'update', size,
+                         data={'name': 'renombrado', 'question_time': 60, 'answer_time': 60})
+            self.request(client, 'patch', f'/api/games/{games[0].id}/', 'partial_update', size,
+                         data={'question_time': 120})
+            # the cached game state is dropped by the update
+            self.assertEqual(get_game_state(games[0].id).game.question_time, 120)
+            self.request(client, 'delete', f'/api/games/{games[-1].id}/', 'destroy', size)
+            self.request(client, 'get', '/api/games/recent_states/', 'recent_states', size)
+            self.request(client, 'post', '/api/games/states/', 'states', size,
+                         data={'ids': [g.id for g in games + started]})
+            self.request(client, 'post', '/api/games/tournament/', 'tournament', size,
+                         data={'name': 'copa', 'games': size, 'players': [u.username for u in users]})
+
+    def test_profile(self):
+        for size in SIZES:
+            users, games, started, client = self.seed(size)
+
+            self.request(client, 'get', '/api/profile/', 'profile', size)
+            client.force_authenticate(users[-1])
+            self.request(client, 'get', '/api/profile/games_created/', 'profile games_created', size)
+            self.request(client, 'get', '/api/profile/games_joined/', 'profile games_joined', size)
+
+
+# the async views may query from another connection than the one of the TestCase transaction
+class AsyncViewQueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    BUDGETS = {
+        'join_game': 6,
+        'unjoin_game': 5,
+        'state': 2,
+    }
+
+    def setUp(self):
+        cache.clear()
+        user_cache.items.clear()
+
+    async def request(self, url, label, size, user):
+        from trivia_api.async_views import _background
+
+        async with capture_queries() as queries:
+            response = await AsyncClient().post(url, AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            # the broadcast and lobby count sent after the response
+            while _background:
+                await asyncio.wait(set(_background))
+        self.assertLess(response.status_code, 400, response.content)
+        self.assertQueryBudget(queries, self.BUDGETS[label], f'{label} with {size} players')
+
+    async def test_join(self):
+        for size in SIZES:
+            users = await sync_to_async(seed_users)(f'j{size}', size + 1)
+            game = await sync_to_async(seed_game)(users[0], users[1:-1])
+            started = await sync_to_async(seed_game)(users[0], users[1:], started=timezone.now())
+
+            await self.request(f'/api/games/{game.id}/join_game/', 'join_game', size, users[-1])
+            await self.request(f'/api/games/{game.id}/unjoin_game/', 'unjoin_game', size, users[-1])
+            await self.request(f'/api/games/{started.id}/state/', 'state', size, users[-1])
+
+    async def test_inactive_user(self):
+        users = await sync_to_async(seed_users)('inactive', 2)
+        game = await sync_to_async(seed_game)(users[0], [])
+        await User.objects.filter(id=users[1].id).aupdate(is_active=False)
+
+        response = await AsyncClient().post(f'/api/games/{game.id}/join_game/',
+                                            AUTHORIZATION=f'Bearer {AccessToken.for_user(users[1])}')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(await Membership.objects.filter(game=game, player=users[1]).aexists())
+
+
+class IndexTests(TestCase):
+    def test_hot_queries_use_their_index(self):
+        missing = [(index_name, plan) for index_name, used, plan in check_indexes() if not used]
+        if missing:
+            self.fail('Queries not using their index:\n' +
+                      '\n'.join(f'  {index_name}:\n    {plan}' for index_name, plan in missing))
+
+
+class AdminQueryBudgetTests(QueryBudgetMixin, TestCase):
+    BUDGETS = {
+        'game': 6,
+        'membership': 6,
+        'round': 7,
+        'move': 6,
+        'qualification': 7,
+        'fault': 7,
+        'actionerror': 8,
+    }
+
+    def seed(self, size):
+        # a game of size players with one round per player, every move graded by another player
+        users = seed_users(f'a{size}', size)
+        game = seed_game(users[0], users[1:], started=timezone.now())
+        for number, nosy in enumerate(users, 1):
+            c_round = Round.objects.create(game=game, number=number, nosy=nosy, question='¿Pregunta?')
+            moves = Move.objects.bulk_create([Move(round=c_round, player=p, answer='respuesta', evaluation=2)
+                                              for p in users])
+            Qualification.objects.bulk_create([Qualification(player=users[i - 1], move=m, is_correct=True)
+                                               for i, m in enumerate(moves)])
+            Fault.objects.bulk_create([Fault(round=c_round, player=p, category='AT', fault_value=1) for p in users])
+            ActionError.objects.bulk_create([ActionError(round=c_round, player=p, action='answer',
+                                                         error_message='error') for p in users])
+
+    def test_changelists(self):
+        admin_user = User.objects.create_superuser('admin')
+        self.client.force_login(admin_user)
+
+        for size in SIZES:
+            self.seed(size)
+            for model, budget in self.BUDGETS.items():
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(f'/admin/trivia_api/{model}/')
+                self.assertEqual(response.status_code, 200)
+                self.assertQueryBudget(queries, budget, f'{model} changelist with {size} players')
+
+
+# two layer instances behave like two daphne processes
+@skipUnless(connection.vendor == 'postgresql', 'the channel layer runs on PostgreSQL')
+class PostgresChannelLayerTests(TransactionTestCase):
+    async def receive(self, layer, channel):
+        return await asyncio.wait_for(layer.receive(channel), 5)
+
+    async def run_layers(self, test):
+        self.sender = PostgresChannelLayer()
+        self.receiver = PostgresChannelLayer()
+        try:
+            await test()
+        finally:
+            await self.sender.flush()
+            await self.sender.close()
+            await self.receiver.close()
+
+    async def test_send(self):
+        async def test():
+            channel = await self.receiver.new_channel()
+            await self.sender.send(channel, {'type': 'hello', 'n': 1})
+            self.assertEqual(await self.receive(self.receiver, channel), {'type': 'hello', 'n': 1})
+        await self.run_layers(test)
+
+    async def test_group_send(self):
+        async def test():
+            local = await self.sender.new_channel()
+            remote = [await self.receiver.new_channel() for _ in range(3)]
+            await self.sender.group_add('game_1', local)
+            for channel in remote:
+                await self.receiver.group_add('game_1', channel)
+
+            await self.sender.group_send('game_1', {'type': 'round'})
+            for layer, channel in [(self.sender, local)] + [(self.receiver, c) for c in remote]:
+                self.assertEqual(await self.receive(layer, channel), {'type': 'round'})
+        await self.run_layers(test)
+
+    async def test_group_add_from_another_process(self):
+        async def test():
+            channel = await self.receiver.new_channel()
+            await self.sender.group_add('game_1', channel)
+            await self.sender.group_send('game_1', {'type': 'first'})
+            self.assertEqual(await self.receive(self.receiver, channel), {'type': 'first'})
+
+            await self.sender.group_discard('game_1', channel)
+            await self.sender.group_send('game_1', {'type': 'discarded'})
+            await self.sender.send(channel, {'type': 'direct'})
+            self.assertEqual(await self.receive(self.receiver, channel), {'type': 'direct'})
+        await self.run_layers(test)
+
+    async def test_oversized_payloads_keep_their_order(self):
+        async def test():
+            channels = [await self.receiver.new_channel() for _ in range(3)]
+            for channel in channels:
+                await self.receiver.group_add('game_1', channel)
+
+            sizes = [PostgresChannelLayer.MAX_PAYLOAD * 2 if i % 3 == 0 else 10 for i in range(12)]
+            for i, size in enumerate(sizes):
+                await self.sender.group_send('game_1', {'type': 'event', 'i': i, 'text': 'x' * size})
+            await self.sender.group_send_many([('game_1', {'type': 'event', 'i': 12, 'text': 'x' * sizes[0]}),
+                                               ('game_1', {'type': 'event', 'i': 13, 'text': ''})])
+
+            for channel in channels:
+                received = [(await self.receive(self.receiver, channel))['i'] for _ in range(14)]
+                self.assertEqual(received, list(range(14)))
+        await self.run_layers(test)
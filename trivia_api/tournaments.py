@@ -0,0 +1,48 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from trivia_api.lobby import send_lobby
+from trivia_api.models import Game, Membership
+from trivia_api.serializers import GameLightSerializer
+
+MAX_GAMES = 500
+
+# fields of the template game copied into every game of a tournament
+TEMPLATE_FIELDS = ['name', 'question_time', 'answer_time', 'rounds_number']
+
+
+def find_players(usernames):
+    # players of the list in its order, and the usernames that do not exist
+    users = {u.username: u for u in User.objects.filter(username__in=usernames)}
+    return [users[name] for name in dict.fromkeys(usernames) if name in users], \
+        [name for name in usernames if name not in users]
+
+
+def create_tournament(creator, template, games_number, players):
+    # games_number copies of the template game, each joined by its creator like
+    # GameViewSet.perform_create, and the players dealt among them in turns
+    with transaction.atomic():
+        games = Game.objects.bulk_create([
+            Game(creator=creator, **dict(template, name=f'{template["name"]} {i + 1}'))
+            for i in range(games_number)
+        ])
+
+        enrollments = {game.id: [creator] for game in games}
+        for i, player in enumerate(p for p in players if p.id != creator.id):
+            enrollments[games[i % games_number].id].append(player)
+
+        Membership.objects.bulk_create([
+            Membership(game_id=game_id, player=player)
+            for game_id, game_players in enrollments.items() for player in game_players
+        ])
+
+    return games, enrollments
+
+
+def announce_tournament(games):
+    # the new games as the lobby lists them, sent to ws/lobby/ in one games_created delta
+    games = Game.objects.filter(id__in=[g.id for g in games]).select_related('creator').with_player_count()
+    data = GameLightSerializer(games.order_by('id'), many=True).data
+    async_to_sync(send_lobby)({'type': 'games_created', 'games': data})
+    return data
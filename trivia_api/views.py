@@ -1,224 +1,195 @@
 from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
-from rest_framework import viewsets, status
+from django.contrib.auth.models import User
+from django.db.models import OuterRef
+from django.urls import reverse
+
+from rest_framework import generics, viewsets, status
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 
-from trivia_api.models import Game
-from trivia_api.serializers import GameSerializer, PlayerSerializer
+from trivia_api.cache import invalidate_game_state
+from trivia_api.engine import GameEngine
+from trivia_api.lobby import lobby_game, send_lobby
+from trivia_api.metrics import measure, view_seconds
+from trivia_api.models import Game, Membership, count_of
+from trivia_api.pagination import FirstPagePagination, GamePagination
+from trivia_api.serializers import GameLightSerializer, GameSerializer, PlayerSerializer
+from trivia_api.states import build_games_state
+from trivia_api.tournaments import MAX_GAMES, TEMPLATE_FIELDS, announce_tournament, create_tournament, find_players
 
 
 class GameViewSet(viewsets.ModelViewSet):
     queryset = Game.open.all()
     serializer_class = GameSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = GamePagination
+
+    MAX_STATES = 100
+
+    def is_light(self):
+        # ?view=light lists the lobby without the players of each game
+        return self.action == 'list' and self.request.query_params.get('view') == 'light'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.select_related('creator').with_player_count()
+            if not self.is_light():
+                queryset = queryset.prefetch_related('players')
+
+        return queryset
+
+    def get_serializer_class(self):
+        return GameLightSerializer if self.is_light() else super().get_serializer_class()
+
+    def dispatch(self, request, *args, **kwargs):
+        # timed under the name of the action, known once the request is initialized
+        with measure(view_seconds) as timing:
+            response = super().dispatch(request, *args, **kwargs)
+            timing.name = self.action
+        return response
 
     @action(
-        detail=True,
+        detail=False,
+        methods=['get'],
+    )
+    def recent_states(self, request):
+        games = Game.objects.filter(started__isnull=False).order_by("-started")[:10]
+
+        return Response(
+            data=build_games_state(games),
+            status=status.HTTP_200_OK
+        )
+
+    @action(
+        detail=False,
         methods=['post'],
     )
-    def join_game(self, request, pk=None):
-        game = self.get_object()
-
-        if game.is_open:
-            game.players.add(self.request.user)
-
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'game_{game.id}',
-                {
-                    'type': "game_message",
-                    'message': {'type': 'player_joined',
-                                'userid': self.request.user.id,
-                                'username': self.request.user.username}
-                }
-            )
+    def states(self, request):
+        ids = request.data.get('ids')
 
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
             return Response(
-                data={
-                    "message": "Te has unido correctamente al juego.",
-                    "game_id": game.id,
-                },
-                status=status.HTTP_200_OK
+                data={"message": "Se debe entregar una lista de ids de juegos."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        else:
+        if len(ids) > self.MAX_STATES:
             return Response(
-                data={
-                    "message": "El juego ya comenzó, no permite inscripción.",
-                    "game_id": game.id,
-                },
-                status=status.HTTP_423_LOCKED
+                data={"message": f"No se pueden pedir más de {self.MAX_STATES} juegos a la vez."},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
+        games_state = {gs['id']: gs for gs in build_games_state(Game.objects.filter(id__in=ids))}
+
+        return Response(
+            data=[games_state[i] for i in dict.fromkeys(ids) if i in games_state],
+            status=status.HTTP_200_OK
+        )
+
     @action(
-        detail=True,
+        detail=False,
         methods=['post'],
     )
-    def unjoin_game(self, request, pk=None):
-        game = self.get_object()
-
-        if game.is_open:
-            if game.creator.id != self.request.user.id:
-                if game.players.filter(id=self.request.user.id).exists():
-                    game.players.remove(self.request.user)
-
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        f'game_{game.id}',
-                        {
-                            'type': "game_message",
-                            'message': {'type': 'player_unjoined',
-                                        'userid': self.request.user.id,
-                                        'username': self.request.user.username}
-                        }
-                    )
-
-                    return Response(
-                        data={
-                            "message": "Te has desvinculado correctamente del juego.",
-                            "game_id": game.id,
-                        },
-                        status=status.HTTP_200_OK
-                    )
-                else:
-                    return Response(
-                        data={
-                            "message": "El usuario que se quiere desvincular no está inscrito en el juego.",
-                            "game_id": game.id,
-                        },
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                return Response(
-                    data={
-                        "message": "El crador del juego no puede desvincularse.",
-                        "game_id": game.id,
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        else:
+    def tournament(self, request):
+        games_number = request.data.get('games')
+        usernames = request.data.get('players', [])
+
+        if not isinstance(games_number, int) or not 0 < games_number <= MAX_GAMES:
             return Response(
-                data={
-                    "message": "El juego ya comenzó, no permite desvinculare.",
-                    "game_id": game.id,
-                },
-                status=status.HTTP_423_LOCKED
+                data={"message": f"Se debe indicar un número de juegos entre 1 y {MAX_GAMES}."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-
-    @action(
-        detail=True,
-        methods=['post'],
-        queryset=Game.objects.all(),
-    )
-    def state(self, request, pk=None):
-        game = self.get_object()
-        c_round = game.current_round
-
-        if not game.is_open:
-            game_state = {
-                'rounds': game.rounds_number,
-                'current_round': game.current_round_idx,
-                'round': {
-                    'nosy': c_round.nosy.id if c_round.nosy is not None else None,
-                    'question': c_round.question,
-                    'phase': c_round.current_phase,
-                } if c_round is not None else None,
-                'players': [
-                    {
-                        'id': p.id,
-                        'username': p.username,
-                        'score': game.player_score(p.id),
-                        'faults': game.player_faults(p.id)}
-                    for p in game.players.all()
-                ],
-                'ended': game.ended,
-            }
+        if not isinstance(usernames, list) or not all(isinstance(u, str) for u in usernames):
             return Response(
-                data=game_state,
-                status=status.HTTP_200_OK
+                data={"message": "Se debe entregar una lista de nombres de jugadores."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        else:
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        template = {k: v for k, v in serializer.validated_data.items() if k in TEMPLATE_FIELDS}
+
+        players, unknown = find_players(usernames)
+        if unknown:
             return Response(
-                data={
-                    "message": "El juego aun no ha comenzado.",
-                    "game_id": game.id,
-                },
-                status=status.HTTP_423_LOCKED
+                data={"message": "Hay jugadores que no existen.", "players": unknown},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-    @action(
-        detail=False,
-        methods=['get'],
-    )
-    def recent_states(self, request):
-        games = Game.objects.filter(started__isnull=False).order_by("-started")[:10]
+        games, _ = create_tournament(request.user, template, games_number, players)
 
-        games_state = []
-
-        for game in games:
-            c_round = game.current_round
-            gs = {
-                'id': game.id,
-                'name': game.name,
-                'rounds': game.rounds_number,
-                'question_time': game.question_time,
-                'answer_time': game.answer_time,
-                'creator': game.creator.username,
-                'current_round': game.current_round_idx,
-                'round': {
-                    'started': c_round.started,
-                    'nosy': c_round.nosy.id if c_round.nosy is not None else None,
-                    'question': c_round.question,
-                    'phase': c_round.current_phase,
-                } if c_round is not None else None,
-                'players': [
-                    {
-                        'id': p.id,
-                        'username': p.username,
-                        'score': game.player_score(p.id),
-                        'faults': game.player_faults(p.id),
-                        'errors': game.player_errors(p.id),
-                    }
-                    for p in game.players.all()
-                ],
-                'started': game.started,
-                'ended': game.ended,
-            }
-            games_state.append(gs)
         return Response(
-            data=games_state,
-            status=status.HTTP_200_OK
+            data=announce_tournament(games),
+            status=status.HTTP_201_CREATED
         )
 
     def perform_create(self, serializer):
         instance = serializer.save(creator=self.request.user)
         instance.players.add(self.request.user)
+        async_to_sync(send_lobby)({'type': 'game_created', 'game': lobby_game(instance, 1)})
+
+    def perform_update(self, serializer):
+        instance = serializer.save()
+        invalidate_game_state(instance.id)
 
     def perform_destroy(self, instance):
         if not instance.creator.id == self.request.user.id:
             raise PermissionDenied("You are not allowed to perform this action.")
 
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'game_{instance.id}',
-            {
-                'type': "game_message",
-                'message': {'type': 'game_deleted',
-                            'game': instance.id,
-                            }
-            }
-        )
+        async_to_sync(GameEngine(instance.id).broadcast)({'type': 'game_deleted', 'game': instance.id})
+        async_to_sync(send_lobby)({'type': 'game_deleted', 'game': instance.id})
+        invalidate_game_state(instance.id)
         instance.delete()
 
 
+def created_games(user):
+    return Game.objects.filter(creator=user).select_related('creator').with_player_count()
+
+
+def joined_games(user):
+    return Game.objects.filter(memberships__player=user).select_related('creator').with_player_count()
+
+
 class ProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = PlayerSerializer(request.user)
+        player = User.objects.annotate(
+            games_created_count=count_of(Game.objects.filter(creator=OuterRef('pk'))),
+            games_joined_count=count_of(Membership.objects.filter(player=OuterRef('pk'))),
+        ).get(id=request.user.id)
+        data = PlayerSerializer(player).data
+
+        # first page of each list, with the link to the next page of its own endpoint
+        for name, games in [('games_created', created_games(player)), ('games_joined', joined_games(player))]:
+            paginator = FirstPagePagination()
+            page = paginator.paginate_queryset(games, request)
+            paginator.base_url = request.build_absolute_uri(reverse(f'profile-{name}'))
+
+            data[name] = GameLightSerializer(page, many=True).data
+            data[f'{name}_next'] = paginator.get_next_link()
+
+        return Response(data)
+
+
+class ProfileGamesCreatedView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = GameLightSerializer
+    pagination_class = GamePagination
+
+    def get_queryset(self):
+        return created_games(self.request.user)
+
+
+class ProfileGamesJoinedView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = GameLightSerializer
+    pagination_class = GamePagination
 
-        return Response(serializer.data)
+    def get_queryset(self):
+        return joined_games(self.request.user)